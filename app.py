@@ -1,31 +1,46 @@
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
 import shutil
 import uuid
+import tempfile
 from pathlib import Path
-from dotenv import load_dotenv
+import importlib.util
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 from typing import Optional, List
 import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+import base64
+import re
+from bisect import bisect_left
+import asyncio
+import contextvars
+import threading
+import sqlite3
+import random
+from collections import deque
+import functools
+import hashlib
+import mimetypes
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+import anyio
 
 # Try to import optional dependencies
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
+# supabase (with httpx), Pillow and boto3 are only located here and imported
+# on first use, so a cold start does not pay for modules a request may never
+# touch. SMTP and the email MIME modules are imported the same way.
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
+if not SUPABASE_AVAILABLE:
     print("Warning: Supabase not available")
-    SUPABASE_AVAILABLE = False
-    Client = None
 
 try:
     from jose import JWTError, jwt
@@ -34,12 +49,9 @@ except ImportError:
     print("Warning: JWT not available")
     JWT_AVAILABLE = False
 
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if not PIL_AVAILABLE:
     print("Warning: PIL not available")
-    PIL_AVAILABLE = False
 
 try:
     import bcrypt
@@ -48,8 +60,19 @@ except ImportError:
     print("Warning: bcrypt not available")
     BCRYPT_AVAILABLE = False
 
+# Only needed when uploads are stored in S3
+BOTO3_AVAILABLE = importlib.util.find_spec("boto3") is not None
+
 # Load environment variables
-load_dotenv()
+# Serverless platforms inject the environment directly, so .env is not read there
+if not os.getenv("VERCEL"):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# STARTUP_MODE=eager builds the Supabase client and imports the optional
+# modules while app.py is imported, which suits long-running servers; lazy
+# (the default on Vercel) defers both to the first request that needs them.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy" if os.getenv("VERCEL") else "eager")
 
 app = FastAPI(title="AniAthu's brownies API")
 
@@ -62,89 +85,718 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create uploads directory if it doesn't exist
+# Uploads directory, created by the first upload written to it
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Static assets
+# The frontend directory is indexed once at startup. File bytes, content type,
+# a strong ETag and any .br/.gz variants written by build_static.py are held
+# in memory, so serving an asset never touches the filesystem. Files listed
+# in frontend/dist/manifest.json carry a content hash in their name and are
+# cached as immutable.
+STATIC_DIR = Path("frontend")
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+class StaticAsset:
+    """An indexed frontend file and its precompressed variants"""
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.body = body
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.encoded = {}
+
+def build_static_index(root: Path):
+    """Map every file under root (by relative path) to a StaticAsset"""
+    index = {}
+    if not root.is_dir():
+        return index
+    manifest_path = root / "dist" / "manifest.json"
+    hashed = set()
+    if manifest_path.is_file():
+        hashed = {f"dist/{name}" for name in json.loads(manifest_path.read_text(encoding="utf-8")).values()}
+    for path in root.rglob("*"):
+        if not path.is_file() or path.suffix in (".br", ".gz"):
+            continue
+        relative = path.relative_to(root).as_posix()
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        cache_control = "public, max-age=31536000, immutable" if relative in hashed else "public, max-age=3600"
+        asset = StaticAsset(path.read_bytes(), content_type, cache_control)
+        for encoding, suffix in STATIC_ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if variant.is_file():
+                asset.encoded[encoding] = variant.read_bytes()
+        index[relative] = asset
+    return index
+
+static_index = build_static_index(STATIC_DIR)
+
+def accepted_encodings(header: str):
+    """Content codings from an Accept-Encoding header, minus any refused with q=0"""
+    encodings = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes on either side are ignored
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in [candidate.removeprefix("W/") for candidate in candidates]
+
+def static_response(request: Request, asset: StaticAsset, cache_control: Optional[str] = None):
+    """Serve an indexed asset, picking the best precompressed variant and honoring If-None-Match"""
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding = next((coding for coding, _ in STATIC_ENCODINGS if coding in asset.encoded and coding in accepted), None)
+    etag = asset.etag if encoding is None else f'{asset.etag[:-1]}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control or asset.cache_control,
+        "Vary": "Accept-Encoding"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(asset.encoded[encoding], media_type=asset.content_type, headers=headers)
+    return Response(asset.body, media_type=asset.content_type, headers=headers)
 
 # Static file serving for Vercel
 @app.get("/static/{file_path:path}")
-async def serve_static(file_path: str):
-    """Serve static files from frontend directory"""
-    static_file_path = Path("frontend") / file_path
-    
-    if not static_file_path.exists():
+async def serve_static(file_path: str, request: Request):
+    """Serve static files from the in-memory frontend index"""
+    asset = static_index.get(file_path)
+    if asset is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Determine content type
-    content_type = "text/plain"
-    if file_path.endswith('.css'):
-        content_type = "text/css"
-    elif file_path.endswith('.js'):
-        content_type = "application/javascript"
-    elif file_path.endswith('.html'):
-        content_type = "text/html"
-    elif file_path.endswith('.png'):
-        content_type = "image/png"
-    elif file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
-        content_type = "image/jpeg"
-    elif file_path.endswith('.gif'):
-        content_type = "image/gif"
-    elif file_path.endswith('.svg'):
-        content_type = "image/svg+xml"
-    
-    return FileResponse(
-        static_file_path,
-        media_type=content_type,
-        headers={"Cache-Control": "public, max-age=3600"}
-    )
+    return static_response(request, asset)
 
 # Upload file serving for Vercel
-@app.get("/uploads/{file_path:path}")
-async def serve_uploads(file_path: str):
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_uploads(file_path: str, request: Request):
     """Serve uploaded files"""
-    upload_file_path = Path("uploads") / file_path
-    
-    if not upload_file_path.exists():
+    # Keys are flat content hashes; anything else (paths, temp files) is not an upload
+    if "/" in file_path or "\\" in file_path or file_path.startswith("."):
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Determine content type for images
-    content_type = "application/octet-stream"
-    if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-        if file_path.lower().endswith('.png'):
-            content_type = "image/png"
-        elif file_path.lower().endswith(('.jpg', '.jpeg')):
-            content_type = "image/jpeg"
-        elif file_path.lower().endswith('.gif'):
-            content_type = "image/gif"
-        elif file_path.lower().endswith('.webp'):
-            content_type = "image/webp"
-    
-    return FileResponse(
-        upload_file_path,
-        media_type=content_type,
-        headers={"Cache-Control": "public, max-age=86400"}
-    )
+    return await upload_response(request, file_path)
 
-# Initialize Supabase client
-try:
-    if SUPABASE_AVAILABLE:
-        supabase: Client = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_KEY")
+# Supabase transport
+# Every PostgREST call goes through one pooled httpx session. Connections are
+# kept alive between queries (up to SUPABASE_MAX_KEEPALIVE of them, for
+# SUPABASE_KEEPALIVE_SECONDS) so bursts reuse warm TLS connections instead of
+# opening new ones, and SUPABASE_HTTP2 multiplexes queries over a single
+# connection. Connection churn and pool utilization are exported at /metrics.
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "32"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", str(SUPABASE_MAX_CONNECTIONS)))
+SUPABASE_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "60"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "false").lower() in ("1", "true", "yes")
+# A query that outlives DB_TIMEOUT_SECONDS has already failed the request, so stop waiting for it too
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", os.getenv("DB_TIMEOUT_SECONDS", "10")))
+SUPABASE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONNECT_TIMEOUT_SECONDS", "5"))
+
+class SupabasePool:
+    """Pooled HTTP session for PostgREST calls and its utilization counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+        self.http2 = False
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def install(self, client):
+        """Replace the default PostgREST session of a Supabase client with the pooled one"""
+        import httpx
+        from postgrest.utils import SyncClient
+
+        http2 = SUPABASE_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("Warning: SUPABASE_HTTP2 needs the h2 package (pip install h2) - using HTTP/1.1")
+            http2 = False
+        default = client.postgrest.session
+        self.session = SyncClient(
+            base_url=default.base_url,
+            headers=default.headers,
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT_SECONDS, connect=SUPABASE_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS
+            ),
+            http2=http2,
+            event_hooks={"request": [self.on_request]}
         )
-        print("Supabase client initialized successfully")
-    else:
-        supabase = None
-        print("Supabase not available - running in limited mode")
-except Exception as e:
-    print(f"Failed to initialize Supabase client: {e}")
-    supabase = None
+        self.http2 = http2
+        client.postgrest.session = self.session
+        default.close()
+
+    def on_request(self, request):
+        # httpcore reports connection setup through the trace extension
+        request.extensions["trace"] = self.trace
+        with self.lock:
+            self.requests += 1
+
+    def trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            with self.lock:
+                self.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            with self.lock:
+                self.tls_handshakes += 1
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "http2": self.http2,
+                "max_connections": SUPABASE_MAX_CONNECTIONS,
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes
+            }
+        pool = getattr(getattr(self.session, "_transport", None), "_pool", None)
+        connections = pool.connections if pool is not None else []
+        idle = sum(1 for connection in connections if connection.is_idle())
+        stats.update({
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "waiting": sum(1 for status in list(getattr(pool, "_requests", [])) if status.connection is None)
+        })
+        return stats
+
+supabase_pool = SupabasePool()
+
+# Supabase client
+# Created on first use and shared by every request and worker thread.
+supabase = None
+supabase_initialized = False
+supabase_lock = threading.Lock()
+
+def get_supabase():
+    """Return the shared Supabase client, creating it on first call"""
+    global supabase, supabase_initialized
+    if supabase_initialized:
+        return supabase
+    with supabase_lock:
+        if not supabase_initialized:
+            try:
+                if SUPABASE_AVAILABLE:
+                    from supabase import create_client
+                    supabase = create_client(
+                        os.getenv("SUPABASE_URL"),
+                        os.getenv("SUPABASE_KEY")
+                    )
+                    supabase_pool.install(supabase)
+                    print("Supabase client initialized successfully")
+                else:
+                    print("Supabase not available - running in limited mode")
+            except Exception as e:
+                print(f"Failed to initialize Supabase client: {e}")
+                supabase = None
+            supabase_initialized = True
+    return supabase
+
+# Request metrics
+# Every request gets a RequestMetrics object in a context variable. The data
+# access layer and the SMTP transport add their calls to it, and the
+# middleware folds the totals into per-route histograms exported at /metrics
+# in Prometheus text format and reports them in a Server-Timing header.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestMetrics:
+    """Backend calls made while handling one request"""
+
+    def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+
+class MetricsRegistry:
+    """Process-wide request and backend call counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {}
+        self.slow = {}
+        self.backend_calls = {}
+        self.backend_seconds = {}
+        self.route_paths = None
+
+    def route_label(self, request: Request):
+        # The router leaves the matched endpoint in the scope; label by its path template
+        if self.route_paths is None:
+            self.route_paths = {route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")}
+        return self.route_paths.get(request.scope.get("endpoint"), "unmatched")
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, slow: bool):
+        with self.lock:
+            key = (method, route, str(status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.histograms.setdefault((method, route), [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if slow:
+                self.slow[(method, route)] = self.slow.get((method, route), 0) + 1
+
+    def observe_backend(self, backend: str, seconds: float):
+        with self.lock:
+            self.backend_calls[backend] = self.backend_calls.get(backend, 0) + 1
+            self.backend_seconds[backend] = self.backend_seconds.get(backend, 0.0) + seconds
+
+    def render(self):
+        """Prometheus text exposition format"""
+        def labels(**values):
+            return "{" + ",".join(f'{name}="{value}"' for name, value in values.items()) + "}"
+
+        lines = []
+        with self.lock:
+            lines += ["# HELP http_requests_total Requests handled, by route and status.", "# TYPE http_requests_total counter"]
+            for (method, route, code), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method=method, route=route, status=code)} {count}")
+            lines += ["# HELP http_request_duration_seconds Request latency, by route.", "# TYPE http_request_duration_seconds histogram"]
+            for (method, route), (buckets, total, count) in sorted(self.histograms.items()):
+                for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f"http_request_duration_seconds_bucket{labels(method=method, route=route, le=bound)} {bucket_count}")
+                lines.append(f"http_request_duration_seconds_bucket{labels(method=method, route=route, le='+Inf')} {count}")
+                lines.append(f"http_request_duration_seconds_sum{labels(method=method, route=route)} {total:.6f}")
+                lines.append(f"http_request_duration_seconds_count{labels(method=method, route=route)} {count}")
+            lines += [f"# HELP http_slow_requests_total Requests slower than {SLOW_REQUEST_SECONDS}s.", "# TYPE http_slow_requests_total counter"]
+            for (method, route), count in sorted(self.slow.items()):
+                lines.append(f"http_slow_requests_total{labels(method=method, route=route)} {count}")
+            lines += ["# HELP backend_calls_total Calls to Supabase and SMTP, including background jobs.", "# TYPE backend_calls_total counter"]
+            for backend, count in sorted(self.backend_calls.items()):
+                lines.append(f"backend_calls_total{labels(backend=backend)} {count}")
+            lines += ["# HELP backend_call_duration_seconds_total Time spent in Supabase and SMTP calls.", "# TYPE backend_call_duration_seconds_total counter"]
+            for backend, seconds in sorted(self.backend_seconds.items()):
+                lines.append(f"backend_call_duration_seconds_total{labels(backend=backend)} {seconds:.6f}")
+        pool = supabase_pool.stats()
+        lines += [
+            "# HELP supabase_pool_connections Open PostgREST connections, by state.", "# TYPE supabase_pool_connections gauge",
+            f"supabase_pool_connections{labels(state='active')} {pool['active']}",
+            f"supabase_pool_connections{labels(state='idle')} {pool['idle']}",
+            "# HELP supabase_pool_max_connections Configured PostgREST connection limit.", "# TYPE supabase_pool_max_connections gauge",
+            f"supabase_pool_max_connections {pool['max_connections']}",
+            "# HELP supabase_pool_waiting_requests Queries waiting for a free connection.", "# TYPE supabase_pool_waiting_requests gauge",
+            f"supabase_pool_waiting_requests {pool['waiting']}",
+            "# HELP supabase_pool_requests_total HTTP requests sent to PostgREST.", "# TYPE supabase_pool_requests_total counter",
+            f"supabase_pool_requests_total {pool['requests']}",
+            "# HELP supabase_pool_connections_opened_total New PostgREST connections; compare with requests for the reuse rate.", "# TYPE supabase_pool_connections_opened_total counter",
+            f"supabase_pool_connections_opened_total {pool['connections_opened']}",
+            "# HELP supabase_pool_tls_handshakes_total TLS handshakes with PostgREST.", "# TYPE supabase_pool_tls_handshakes_total counter",
+            f"supabase_pool_tls_handshakes_total {pool['tls_handshakes']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+current_request_metrics = contextvars.ContextVar("current_request_metrics", default=None)
+
+def record_backend_call(backend: str, seconds: float):
+    """Count a Supabase or SMTP call globally and against the current request, if any"""
+    metrics.observe_backend(backend, seconds)
+    request_metrics = current_request_metrics.get()
+    if request_metrics is not None:
+        request_metrics.calls[backend] = request_metrics.calls.get(backend, 0) + 1
+        request_metrics.seconds[backend] = request_metrics.seconds.get(backend, 0.0) + seconds
+
+async def instrument_requests(request: Request, call_next):
+    """Time each request, count its backend calls and report them
+
+    Registered after every other middleware (see limit_upload_size) so it is
+    the outermost one and also sees requests they answer themselves.
+    """
+    request_metrics = RequestMetrics()
+    current_request_metrics.set(request_metrics)
+    started = time.perf_counter()
+    # An exception escaping the app reaches the client as a 500
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = metrics.route_label(request)
+        slow = elapsed >= SLOW_REQUEST_SECONDS
+        metrics.observe_request(request.method, route, status_code, elapsed, slow)
+        if slow:
+            calls = ", ".join(f"{backend} x{count}" for backend, count in request_metrics.calls.items()) or "no backend calls"
+            print(f"Slow request: {request.method} {route} {status_code} took {elapsed:.2f}s ({calls})")
+    
+    timings = [f"app;dur={elapsed * 1000:.1f}"]
+    for backend, count in request_metrics.calls.items():
+        timings.append(f'{backend};dur={request_metrics.seconds[backend] * 1000:.1f};desc="{count} calls"')
+    response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+# Data access layer
+# supabase-py only ships a synchronous PostgREST client, so every query is
+# executed on a bounded thread pool instead of on the event loop.
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "16"))
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "10"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="supabase")
+db_semaphore = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+
+def table(name: str):
+    """Start a query builder for a Supabase table"""
+    client = get_supabase()
+    if not client:
+        raise HTTPException(status_code=500, detail="Database not available")
+    return client.table(name)
+
+def rpc(function: str, params: dict):
+    """Start a query builder for a Postgres function call"""
+    client = get_supabase()
+    if not client:
+        raise HTTPException(status_code=500, detail="Database not available")
+    return client.rpc(function, params)
+
+def execute_query(query):
+    """Execute a query builder on the calling thread, for code that already runs off the event loop"""
+    started = time.perf_counter()
+    try:
+        return query.execute()
+    finally:
+        record_backend_call("supabase", time.perf_counter() - started)
+
+async def run_query(query, timeout: Optional[float] = None):
+    """Execute a query builder on the database thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+
+    async def execute():
+        async with db_semaphore:
+            started = time.perf_counter()
+            try:
+                return await loop.run_in_executor(db_executor, query.execute)
+            finally:
+                record_backend_call("supabase", time.perf_counter() - started)
+
+    try:
+        return await asyncio.wait_for(execute(), timeout or DB_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database request timed out")
+
+# Postgres functions from database_setup.sql that this database does not have
+missing_functions = set()
+
+async def run_function(function: str, params: dict, fallback):
+    """Call a database function, using the fallback coroutine if it has not been installed"""
+    if function not in missing_functions:
+        try:
+            result = await run_query(rpc(function, params))
+            return result.data
+        except Exception as e:
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            print(f"{function} function not found - using fallback queries")
+            missing_functions.add(function)
+    return await fallback()
+
+# Request coalescing
+# Page loads fire the same reads from many clients at once. Concurrent
+# identical reads share one in-flight backend call and all receive its
+# result, so callers must treat the returned objects as read-only.
+class SingleFlight:
+    """Deduplicate concurrent calls that share the same key"""
+
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self.calls[key] = future
+            future.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.shared += 1
+        # Shield so a cancelled caller does not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {"in_flight": len(self.calls), "shared": self.shared}
+
+single_flight = SingleFlight()
+
+def coalesce(fn):
+    """Decorator sharing in-flight calls of an async read helper with identical arguments"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        key = (fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        return await single_flight.do(key, fn, *args, **kwargs)
+    return wrapper
+
+@coalesce
+async def fetch_settings():
+    """Read and parse every row of the settings table"""
+    result = await run_query(table("settings").select("key, value"))
+    return {row["key"]: json.loads(row["value"]) for row in result.data}
+
+# Product catalog cache
+# The catalog only changes through the admin product routes, so reads are
+# served from memory. Admin writes update the cache in place and the TTL
+# picks up changes made by other workers or directly in Supabase. Search and
+# category browsing use an inverted index rebuilt alongside the cache. What a
+# customer is charged never depends on it: checkout and the cart read prices
+# from the database and correct the cache when it has drifted.
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+PRODUCT_SORTS = {
+    "price_asc": (lambda product: float(product.get("price") or 0), False),
+    "price_desc": (lambda product: float(product.get("price") or 0), True),
+    "name": (lambda product: (product.get("name") or "").lower(), False),
+    "newest": (lambda product: product["id"], True)
+}
+
+def search_tokens(text: str):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class ProductCatalog:
+    """In-memory copy of the products table with a precomputed available list"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.products = {}
+        self.available = []
+        self.categories = {}
+        self.postings = {}
+        self.terms = []
+        self.loaded_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def is_fresh(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def load(self):
+        result = await run_query(table("products").select("*").order("id"))
+        self.products = {row["id"]: row for row in result.data}
+        self.rebuild()
+        self.loaded_at = time.monotonic()
+
+    async def ensure_loaded(self):
+        if self.is_fresh():
+            self.hits += 1
+            return
+        self.misses += 1
+        await single_flight.do("catalog", self.load)
+
+    def rebuild(self):
+        self.available = [product for product in self.products.values() if product.get("available")]
+        # Category lists and token -> product id postings over available products
+        categories = {}
+        postings = {}
+        for product in self.available:
+            categories.setdefault((product.get("category") or "").lower(), []).append(product)
+            text = " ".join(str(product.get(field) or "") for field in ("name", "description", "category"))
+            for token in set(search_tokens(text)):
+                postings.setdefault(token, set()).add(product["id"])
+        self.categories = categories
+        self.postings = postings
+        self.terms = sorted(postings)
+
+    def matching_ids(self, query: str):
+        """Ids of products containing every query word, each matched as a prefix"""
+        ids = None
+        for token in search_tokens(query):
+            matched = set()
+            # Terms are sorted, so all terms starting with token are contiguous
+            for term in self.terms[bisect_left(self.terms, token):]:
+                if not term.startswith(token):
+                    break
+                matched |= self.postings[term]
+            ids = matched if ids is None else ids & matched
+            if not ids:
+                return set()
+        return ids
+
+    async def search(self, q: Optional[str] = None, category: Optional[str] = None,
+                     min_price: Optional[float] = None, max_price: Optional[float] = None, sort: Optional[str] = None):
+        """Available products filtered by text, category and price range"""
+        await self.ensure_loaded()
+        results = self.categories.get(category.lower(), []) if category else self.available
+        if q:
+            ids = self.matching_ids(q)
+            if ids is not None:
+                results = [product for product in results if product["id"] in ids]
+        if min_price is not None:
+            results = [product for product in results if float(product.get("price") or 0) >= min_price]
+        if max_price is not None:
+            results = [product for product in results if float(product.get("price") or 0) <= max_price]
+        if sort:
+            key, reverse = PRODUCT_SORTS[sort]
+            results = sorted(results, key=key, reverse=reverse)
+        return results
+
+    async def list_available(self):
+        await self.ensure_loaded()
+        return self.available
+
+    async def get(self, product_id: int):
+        """Look up a product, asking the database about ids the cache has not seen yet"""
+        await self.ensure_loaded()
+        product = self.products.get(product_id)
+        if product is None:
+            # Created by another worker or directly in Supabase since the last load
+            result = await run_query(table("products").select("*").eq("id", product_id))
+            if result.data:
+                product = result.data[0]
+                self.put(product)
+        return product
+
+    async def get_many(self, product_ids: List[int]):
+        """Look up several products, fetching any the cache has not seen yet in one query"""
+        await self.ensure_loaded()
+        missing = [product_id for product_id in set(product_ids) if product_id not in self.products]
+        if missing:
+            result = await run_query(table("products").select("*").in_("id", missing))
+            for product in result.data:
+                self.put(product)
+        return {product_id: self.products[product_id] for product_id in product_ids if product_id in self.products}
+
+    async def get_fresh(self, product_ids: List[int]):
+        """Read products from the database, bypassing the cache, and update cached copies that differ"""
+        product_ids = sorted(set(product_ids))
+        result = await run_query(table("products").select("*").in_("id", product_ids))
+        products = {product["id"]: product for product in result.data}
+        for product_id in product_ids:
+            if product_id not in products:
+                if product_id in self.products:
+                    self.remove(product_id)
+            elif self.products.get(product_id) != products[product_id]:
+                self.put(products[product_id])
+        return products
+
+    def put(self, product: dict):
+        self.products[product["id"]] = product
+        self.rebuild()
+
+    def remove(self, product_id: int):
+        self.products.pop(product_id, None)
+        self.rebuild()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def stats(self):
+        return {
+            "products": len(self.products),
+            "available": len(self.available),
+            "hits": self.hits,
+            "misses": self.misses,
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None
+        }
+
+catalog = ProductCatalog(CATALOG_TTL_SECONDS)
+
+# Settings store
+SETTINGS_TTL_SECONDS = float(os.getenv("SETTINGS_TTL_SECONDS", "300"))
+
+SETTINGS_DEFAULTS = {
+    "contact_info": {"email": "contact@brownieshop.com", "phone": "+91-9876543210", "address": "123 Brownie St"},
+    "payment_info": {"qr_code_url": "", "payment_email": "payments@brownieshop.com"},
+    "company_info": {"name": "AniAthu's brownies", "tagline": "Premium Handcrafted Brownies"}
+}
+
+class SettingsStore:
+    """Parsed copy of the settings table, refreshed by the admin settings routes"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.values = {}
+        self.etag = None
+        self.loaded_at = None
+
+    def is_fresh(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def ensure_loaded(self):
+        if not self.is_fresh():
+            self.values = {**SETTINGS_DEFAULTS, **await fetch_settings()}
+            self.loaded_at = time.monotonic()
+            self.update_etag()
+
+    def update_etag(self):
+        body = json.dumps(self.values, sort_keys=True, separators=(",", ":"))
+        self.etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+    async def get(self, key: str):
+        await self.ensure_loaded()
+        return self.values.get(key)
+
+    async def get_all(self):
+        await self.ensure_loaded()
+        return self.values
+
+    def put(self, key: str, value: dict):
+        self.values = {**self.values, key: value}
+        self.update_etag()
+
+settings_store = SettingsStore(SETTINGS_TTL_SECONDS)
 
 # Security
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Resolved once at startup instead of on every admin request
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
+
+# Verified token cache
+# Repeat requests from the same session skip signature verification. Entries
+# are keyed by a digest of the whole token, so a tampered token never hits,
+# and are dropped once the token's exp has passed.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+class TokenCache:
+    """Bounded LRU of verified tokens mapping to their subject"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        email, expires_at = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return email
+
+    def put(self, token: str, email: str, expires_at):
+        # Tokens without an expiry are verified every time
+        if not expires_at or self.max_size <= 0:
+            return
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        self.entries[key] = (email, float(expires_at))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
 
 # Models
 class UserCreate(BaseModel):
@@ -161,6 +813,7 @@ class Product(BaseModel):
     description: str
     price: float
     image_url: Optional[str] = None
+    image_variants: Optional[dict] = None
     category: str = "brownie"
     available: bool = True
 
@@ -169,6 +822,7 @@ class ProductUpdate(BaseModel):
     description: Optional[str] = None
     price: Optional[float] = None
     image_url: Optional[str] = None
+    image_variants: Optional[dict] = None
     category: Optional[str] = None
     available: Optional[bool] = None
 
@@ -176,6 +830,9 @@ class CartItem(BaseModel):
     product_id: int
     quantity: int
 
+class CartUpdate(BaseModel):
+    items: List[CartItem]
+
 class ContactInfo(BaseModel):
     email: str
     phone: str
@@ -189,14 +846,23 @@ class CompanyInfo(BaseModel):
     name: str
     tagline: str
 
+class OrderItem(BaseModel):
+    product_id: int
+    quantity: int
+    price: Optional[float] = None
+
 class OrderCreate(BaseModel):
-    items: List[dict]
-    total_amount: float
+    items: List[OrderItem]
+    total_amount: Optional[float] = None
 
 class PaymentUpload(BaseModel):
     order_id: int
     notes: Optional[str] = None
 
+class PaymentApproval(BaseModel):
+    upload_ids: List[int]
+    admin_notes: Optional[str] = None
+
 # Helper functions
 def create_access_token(data: dict):
     if not JWT_AVAILABLE:
@@ -207,20 +873,25 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not JWT_AVAILABLE:
         raise HTTPException(status_code=500, detail="JWT not available")
+    token = credentials.credentials
+    email = token_cache.get(token)
+    if email is not None:
+        return email
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache.put(token, email, payload.get("exp"))
         return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def verify_admin(email: str = Depends(verify_token)):
-    if email != os.getenv("ADMIN_EMAIL"):
+async def verify_admin(email: str = Depends(verify_token)):
+    if email != ADMIN_EMAIL:
         raise HTTPException(status_code=403, detail="Admin access required")
     return email
 
@@ -230,7 +901,7 @@ def hash_password(password: str):
     # Truncate password to 72 bytes for bcrypt compatibility
     password_bytes = password.encode('utf-8')[:72]
     # Generate salt and hash password
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -242,65 +913,1227 @@ def verify_password(plain_password: str, hashed_password: str):
     hashed_bytes = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password_bytes, hashed_bytes)
 
+# Password worker pool
+# bcrypt releases the GIL while hashing, so a thread pool sized to the core
+# count keeps the event loop free and lets logins scale across cores. Work
+# beyond PASSWORD_MAX_PENDING queued calls is rejected with 503.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+
+class PasswordPoolStats:
+    """Queue depth and timing counters for the password worker pool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.wait_seconds = 0.0
+        self.work_seconds = 0.0
+
+    def snapshot(self):
+        with self.lock:
+            completed = self.completed or 1
+            return {
+                "workers": PASSWORD_WORKERS,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / completed * 1000, 2),
+                "avg_work_ms": round(self.work_seconds / completed * 1000, 2)
+            }
+
+password_pool_stats = PasswordPoolStats()
+
+async def run_password_task(fn, *args):
+    """Run a bcrypt call on the password pool"""
+    stats = password_pool_stats
+    with stats.lock:
+        if stats.queued + stats.running >= PASSWORD_MAX_PENDING:
+            stats.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please try again", headers={"Retry-After": "1"})
+        stats.queued += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queued)
+    submitted = time.perf_counter()
+
+    def task():
+        started = time.perf_counter()
+        with stats.lock:
+            stats.queued -= 1
+            stats.running += 1
+            stats.wait_seconds += started - submitted
+        try:
+            return fn(*args)
+        finally:
+            with stats.lock:
+                stats.running -= 1
+                stats.completed += 1
+                stats.work_seconds += time.perf_counter() - started
+
+    def release_if_cancelled(future):
+        # A request cancelled while its task was still queued never runs task()
+        if future.cancelled():
+            with stats.lock:
+                stats.queued -= 1
+
+    future = password_executor.submit(task)
+    future.add_done_callback(release_if_cancelled)
+    return await asyncio.wrap_future(future)
+
+# Email delivery
+# One authenticated SMTP connection is kept open and reused for every message
+# instead of paying a TCP + STARTTLS + AUTH handshake per email. Connections
+# idle longer than SMTP_IDLE_SECONDS are replaced before use, and a send that
+# fails on a dropped connection is retried once on a fresh one.
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+# Providers cap whole messages at 20-25 MB and base64 grows attachments by a
+# third, so each message carries at most this many bytes of attachments
+SMTP_MAX_ATTACHMENT_BYTES = int(os.getenv("SMTP_MAX_ATTACHMENT_BYTES", str(15 * 1024 * 1024)))
+
+class SMTPTransport:
+    """Persistent, thread-safe SMTP connection with reconnect on failure"""
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str], starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.server = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.reconnects = 0
+        self.sent = 0
+
+    @property
+    def configured(self):
+        return bool(self.username)
+
+    def connect(self):
+        import smtplib
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if self.starttls:
+                server.starttls()
+            # Local relays and test servers may not offer AUTH at all
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.connections += 1
+        return server
+
+    def close(self):
+        with self.lock:
+            self.disconnect()
+
+    def disconnect(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
+
+    def send(self, msg):
+        """Send a prepared message, reusing the open connection when possible"""
+        import smtplib
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+                # Servers drop idle sessions; start fresh rather than fail mid-send
+                self.disconnect()
+            for attempt in range(2):
+                if self.server is None:
+                    self.server = self.connect()
+                started = time.perf_counter()
+                try:
+                    self.server.send_message(msg, self.username, msg["To"])
+                    break
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError) as e:
+                    # Permanent rejections (5xx) other than a closed session are not retried here
+                    if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code != 421:
+                        raise
+                    self.server.close()
+                    self.server = None
+                    if attempt:
+                        raise
+                    self.reconnects += 1
+                finally:
+                    record_backend_call("smtp", time.perf_counter() - started)
+            self.last_used = time.monotonic()
+            self.sent += 1
+
+    def stats(self):
+        return {
+            "connected": self.server is not None,
+            "connections": self.connections,
+            "reconnects": self.reconnects,
+            "sent": self.sent
+        }
+
+smtp_transport = SMTPTransport(SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_STARTTLS)
+
+def build_email(to_email: str, subject: str, body: str, attachment_paths: Optional[List[str]] = None):
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = SMTP_USERNAME
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Add attachments if provided
+    for attachment_path in attachment_paths or []:
+        if not os.path.exists(attachment_path):
+            continue
+        try:
+            with open(attachment_path, "rb") as attachment:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(attachment.read())
+                encoders.encode_base64(part)
+                part.add_header(
+                    'Content-Disposition',
+                    f'attachment; filename= {os.path.basename(attachment_path)}'
+                )
+                msg.attach(part)
+        except Exception as e:
+            print(f"Failed to attach file: {e}")
+    return msg
+
+def deliver_email(to_email: str, subject: str, body: str, attachment_paths: Optional[List[str]] = None):
+    """Send an email, raising on delivery failure so callers can retry"""
+    if not smtp_transport.configured:
+        print("Email credentials not configured - skipping email notification")
+        return False
+    
+    import smtplib
+    try:
+        smtp_transport.send(build_email(to_email, subject, body, attachment_paths))
+    except smtplib.SMTPRecipientsRefused as e:
+        if all(code >= 500 for code, _ in e.recipients.values()):
+            raise PermanentJobError(f"Recipients rejected: {e.recipients}") from e
+        raise
+    except smtplib.SMTPResponseException as e:
+        # 5xx replies (message too large, sender refused, ...) fail the same way on every retry
+        if e.smtp_code >= 500:
+            raise PermanentJobError(f"Rejected by the mail server: {e.smtp_code} {e.smtp_error!r}") from e
+        raise
+    print(f"Email sent successfully to {to_email}")
+    return True
+
 def send_email(to_email: str, subject: str, body: str, attachment_path: Optional[str] = None):
     """Send email notification"""
     try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_username = os.getenv("SMTP_USERNAME")
-        smtp_password = os.getenv("SMTP_PASSWORD")
-        
-        if not all([smtp_username, smtp_password]):
-            print("Email credentials not configured - skipping email notification")
-            return False
-        
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Add attachment if provided
-        if attachment_path and os.path.exists(attachment_path):
+        return deliver_email(to_email, subject, body, [attachment_path] if attachment_path else None)
+    except Exception as e:
+        print(f"Email sending failed: {e}")
+        return False
+
+# Upload storage
+# Uploads are streamed to disk in chunks on a worker thread, capped at
+# UPLOAD_MAX_BYTES, and stored under the SHA-256 of their content so the same
+# photo or receipt uploaded twice occupies one file.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Allowance for multipart boundaries and form fields around the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized multipart bodies from Content-Length before they are parsed"""
+    content_length = request.headers.get("content-length")
+    if (request.headers.get("content-type", "").startswith("multipart/form-data")
+            and content_length and content_length.isdigit()
+            and int(content_length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+        return JSONResponse(status_code=413, content={"detail": "File is too large"})
+    return await call_next(request)
+
+# The middleware registered last runs first, so request metrics wrap everything above
+app.middleware("http")(instrument_requests)
+
+# Where uploads live is pluggable: UPLOAD_STORAGE=local keeps them in
+# UPLOAD_DIR, UPLOAD_STORAGE=s3 puts them in an S3-compatible bucket so every
+# instance (and serverless deployments) sees the same files. Either way they
+# stay addressable as /uploads/<key>, and UPLOAD_SERVE_MODE decides whether
+# that route streams the bytes itself or hands the transfer to nginx
+# (accel), Apache/lighttpd (sendfile) or the bucket (redirect).
+UPLOAD_STORAGE = os.getenv("UPLOAD_STORAGE", "local")
+UPLOAD_SERVE_MODE = os.getenv("UPLOAD_SERVE_MODE", "redirect" if UPLOAD_STORAGE == "s3" else "direct")
+UPLOAD_ACCEL_PREFIX = os.getenv("UPLOAD_ACCEL_PREFIX", "/protected-uploads/")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL")
+S3_URL_EXPIRES_SECONDS = int(os.getenv("S3_URL_EXPIRES_SECONDS", "3600"))
+# Keys are content hashes, so a stored object never changes
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def upload_content_type(key: str):
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+class LocalStorage:
+    """Uploads kept in a directory on local disk"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.created = False
+
+    @property
+    def temp_dir(self):
+        # Temporary files are created next to the uploads so moving them in is a rename;
+        # every write starts with one, so this is where the directory gets created
+        if not self.created:
+            self.root.mkdir(exist_ok=True)
+            self.created = True
+        return self.root
+
+    def path(self, key: str):
+        return self.root / key
+
+    def exists(self, key: str):
+        return self.path(key).exists()
+
+    def put_file(self, source: Path, key: str):
+        os.replace(source, self.path(key))
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def size(self, key: str):
+        try:
+            return self.path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def local_copy(self, key: str):
+        yield self.path(key)
+
+    def url(self, key: str):
+        return None
+
+class S3Storage:
+    """Uploads kept in an S3-compatible bucket (AWS S3, MinIO, R2, ...)"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None, public_url: Optional[str] = None):
+        self.bucket = bucket
+        self.public_url = public_url.rstrip("/") if public_url else None
+        import boto3
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.temp_dir = Path(tempfile.gettempdir())
+
+    def exists(self, key: str):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, source: Path, key: str):
+        self.client.upload_file(str(source), self.bucket, key, ExtraArgs={
+            "ContentType": upload_content_type(key),
+            "CacheControl": UPLOAD_CACHE_CONTROL
+        })
+        source.unlink()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def size(self, key: str):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    @contextmanager
+    def local_copy(self, key: str):
+        directory = tempfile.mkdtemp()
+        try:
+            path = Path(directory) / key
+            self.client.download_file(self.bucket, key, str(path))
+            yield path
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def url(self, key: str):
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=S3_URL_EXPIRES_SECONDS
+        )
+
+    def open(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+def create_upload_storage():
+    if UPLOAD_STORAGE == "s3":
+        if BOTO3_AVAILABLE and S3_BUCKET:
+            return S3Storage(S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_PUBLIC_URL)
+        print("Warning: S3 upload storage needs boto3 and S3_BUCKET - using local uploads directory")
+    return LocalStorage(UPLOAD_DIR)
+
+# Created on first use, so a cold start does not import boto3 for S3 storage
+upload_storage = None
+upload_storage_lock = threading.Lock()
+
+def get_upload_storage():
+    """Return the configured upload storage, creating it on first call"""
+    global upload_storage
+    if upload_storage is None:
+        with upload_storage_lock:
+            if upload_storage is None:
+                upload_storage = create_upload_storage()
+    return upload_storage
+
+class UploadManifest:
+    """Index of stored objects in the uploads table (see database_setup.sql)"""
+
+    def __init__(self):
+        self.available = True
+
+    def record(self, key: str, size: int):
+        # Runs on worker threads; the index is bookkeeping, so failures never fail an upload
+        if not self.available:
+            return
+        try:
+            execute_query(table("uploads").upsert({
+                "key": key,
+                "size": size,
+                "content_type": upload_content_type(key),
+                "storage": get_upload_storage().name,
+                "created_at": datetime.utcnow().isoformat()
+            }, on_conflict="key", ignore_duplicates=True))
+        except Exception as e:
+            if any(code in str(e) for code in ("42P01", "PGRST205")):
+                print("Warning: uploads table not found - upload manifest disabled")
+                self.available = False
+            else:
+                print(f"Upload manifest update failed: {e}")
+
+upload_manifest = UploadManifest()
+
+def store_file(source: Path, key: str):
+    """Move a finished temporary file into storage under key and index it"""
+    size = source.stat().st_size
+    get_upload_storage().put_file(source, key)
+    upload_manifest.record(key, size)
+
+def write_upload(source, extension: str, prefix: str = ""):
+    """Copy an upload stream into storage under its content hash
+
+    Returns (key, created); created is False when an identical file was
+    already stored.
+    """
+    storage = get_upload_storage()
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = storage.temp_dir / f".upload-{uuid.uuid4()}.part"
+    try:
+        with open(temp_path, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File is too large")
+                digest.update(chunk)
+                buffer.write(chunk)
+        key = f"{prefix}{digest.hexdigest()}.{extension}"
+        if storage.exists(key):
+            temp_path.unlink()
+            return key, False
+        store_file(temp_path, key)
+        return key, True
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+async def save_upload(file: UploadFile, extension: str, prefix: str = ""):
+    """Stream an UploadFile to content-addressed storage off the event loop"""
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    await file.seek(0)
+    return await run_in_threadpool(write_upload, file.file, extension, prefix)
+
+CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+def upload_etag(key: str, mtime_ns: int, size: int):
+    """ETag for a stored upload without reading it
+
+    Keys written by write_upload (and their image variants) already carry the
+    content's SHA-256, which makes a strong ETag. Older uploads saved under
+    random names only get a weak one from size and modification time.
+    """
+    if CONTENT_HASH.search(key):
+        return f'"{key}"'
+    return f'W/"{size:x}-{mtime_ns:x}"'
+
+def not_modified_since(if_modified_since: Optional[str], mtime: float):
+    if not if_modified_since:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def parse_range(header: str, size: int):
+    """(start, end) of a single byte range, or None to ignore the header and send everything
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    # Only plain digits: int() would also take signs, as in bytes=--5
+    if any(part and not part.isdigit() for part in (first, last)):
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        else:
+            length = int(last)
+            start = max(0, size - length)
+            end = size - 1
+            if length == 0:
+                start = size
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+class FileRangeResponse(Response):
+    """Send bytes start..end of a local file
+
+    Whole files go out through the ASGI pathsend extension when the server
+    offers it, letting it use sendfile(2) instead of copying through Python.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: Path, start: int, end: int, size: int, status_code: int, headers: dict, media_type: str):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.size = size
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**headers, "Content-Length": str(end - start + 1)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if self.start == 0 and self.end == self.size - 1 and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, "rb") as file:
+            await file.seek(self.start)
+            more_body = True
+            while more_body:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                # A file truncated underneath us ends the response early
+                more_body = bool(chunk) and remaining > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+async def local_upload_response(request: Request, path: Path, content_type: str):
+    """Serve a local upload with strong ETags, conditional requests and byte ranges"""
+    try:
+        stat = await anyio.Path(path).stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    etag = upload_etag(path.name, stat.st_mtime_ns, stat.st_size)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": UPLOAD_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (not if_none_match and not_modified_since(request.headers.get("if-modified-since"), stat.st_mtime)):
+        return Response(status_code=304, headers=headers)
+    
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range needs a strong ETag match or the exact Last-Modified date, otherwise send everything
+    strong_etag = None if etag.startswith("W/") else etag
+    if range_header and size and (not if_range or if_range in (strong_etag, headers["Last-Modified"])):
+        byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size - 1, size, 200, headers, content_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(path, start, end, size, 206, headers, content_type)
+
+async def upload_response(request: Request, key: str):
+    """Respond with a stored upload according to UPLOAD_SERVE_MODE"""
+    content_type = upload_content_type(key)
+    headers = {"Cache-Control": UPLOAD_CACHE_CONTROL}
+    if UPLOAD_SERVE_MODE == "accel":
+        # nginx serves the file from an internal location mapped to the uploads
+        headers["X-Accel-Redirect"] = f"{UPLOAD_ACCEL_PREFIX}{key}"
+        return Response(media_type=content_type, headers=headers)
+    storage = get_upload_storage()
+    if UPLOAD_SERVE_MODE == "sendfile" and isinstance(storage, LocalStorage):
+        headers["X-Sendfile"] = str(storage.path(key).resolve())
+        return Response(media_type=content_type, headers=headers)
+    if UPLOAD_SERVE_MODE == "redirect":
+        url = storage.url(key)
+        if url:
+            # Presigned URLs expire, so only the redirect to a public URL is cached long
+            cache_control = UPLOAD_CACHE_CONTROL if S3_PUBLIC_URL else f"private, max-age={S3_URL_EXPIRES_SECONDS // 2}"
+            return RedirectResponse(url, status_code=302, headers={"Cache-Control": cache_control})
+    if isinstance(storage, LocalStorage):
+        return await local_upload_response(request, storage.path(key), content_type)
+    body = await run_in_threadpool(storage.open, key)
+    if body is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return StreamingResponse(body.iter_chunks(UPLOAD_CHUNK_SIZE), media_type=content_type, headers=headers)
+
+# Image derivatives
+# Product images are resized once at upload time into responsive widths in
+# WebP and JPEG so product cards can pick the smallest adequate file through
+# srcset instead of always downloading the original.
+IMAGE_WIDTHS = [int(width) for width in os.getenv("IMAGE_WIDTHS", "200,400,800").split(",")]
+IMAGE_FORMATS = (("webp", "webp", {"quality": 80, "method": 4}), ("jpeg", "jpg", {"quality": 82, "optimize": True, "progressive": True}))
+
+def image_resample():
+    from PIL import Image
+    try:
+        return Image.Resampling.LANCZOS
+    except AttributeError:
+        return Image.LANCZOS
+
+def plan_image_variants(source, stem: str):
+    """Describe the derivatives of an uploaded image, reading only its header"""
+    from PIL import Image
+    with Image.open(source) as img:
+        width, height = img.size
+        # EXIF orientations 5-8 are rotated by 90 degrees
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+    # Never upscale: widths beyond the original collapse to the original width
+    widths = sorted({min(target, width) for target in IMAGE_WIDTHS})
+    variants = {"width": width, "height": height}
+    for name, extension, _ in IMAGE_FORMATS:
+        variants[name] = [
+            {"width": target, "url": f"/uploads/{stem}-{target}.{extension}"}
+            for target in widths
+        ]
+    return variants
+
+def variants_stored(variants: dict):
+    """Whether every derivative described by plan_image_variants has been written"""
+    return all(
+        get_upload_storage().exists(variant["url"].rsplit("/", 1)[-1])
+        for name, _, _ in IMAGE_FORMATS for variant in variants[name]
+    )
+
+def ready_image_variants(image_url: Optional[str]):
+    """Derivatives of an uploaded product image, or None until all of them exist"""
+    if not PIL_AVAILABLE or not image_url or not image_url.startswith("/uploads/"):
+        return None
+    key = image_url[len("/uploads/"):]
+    try:
+        with get_upload_storage().local_copy(key) as source_path:
+            variants = plan_image_variants(source_path, Path(key).stem)
+        return variants if variants_stored(variants) else None
+    except Exception as e:
+        print(f"Could not check image variants of {key}: {e}")
+        return None
+
+def create_image_variants(key: str, variants: dict):
+    """Write the resized WebP/JPEG copies described by plan_image_variants"""
+    from PIL import Image, ImageOps
+    storage = get_upload_storage()
+    with storage.local_copy(key) as source_path, Image.open(source_path) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.mode != "RGB":
+            # Flatten transparency onto white, JPEG has no alpha channel
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[-1])
+        width, height = img.size
+        for name, _, options in IMAGE_FORMATS:
+            for variant in variants[name]:
+                target = variant["width"]
+                resized = img if target == width else img.resize((target, max(1, round(height * target / width))), image_resample())
+                temp_path = storage.temp_dir / f".variant-{uuid.uuid4()}.part"
+                try:
+                    resized.save(temp_path, format=name.upper(), **options)
+                    store_file(temp_path, variant["url"].rsplit("/", 1)[-1])
+                finally:
+                    temp_path.unlink(missing_ok=True)
+
+# Background jobs
+# Slow side effects (image resizing, email delivery) run on worker threads
+# from a job table in a local SQLite file, so handlers return as soon as the
+# upload is saved and queued work survives restarts. Failed jobs are retried
+# with exponential backoff; a job whose worker died is picked up again once
+# its lease expires. Batch handlers receive every pending job of their name at
+# once, which lets admin notifications go out as a single digest.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "50"))
+
+class PermanentJobError(Exception):
+    """Raised by a job handler for a failure that retrying cannot fix"""
+
+class JobQueue:
+    """Durable job queue processed by in-process worker threads"""
+
+    def __init__(self, path: str, workers: int):
+        self.path = path
+        self.workers = workers
+        self.handlers = {}
+        self.local = threading.local()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=500)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at REAL NOT NULL,
+                locked_until REAL,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, run_at)")
+            self.local.conn = conn
+        return conn
+
+    def handler(self, name: str, batch: bool = False):
+        """Decorator registering the function that runs jobs called name
+
+        A batch handler is called with the list of payloads of all pending jobs
+        of that name instead of one job's payload as keyword arguments.
+        """
+        def register(fn):
+            self.handlers[name] = (fn, batch)
+            return fn
+        return register
+
+    def enqueue(self, name: str, payload: dict, delay: float = 0):
+        now = time.time()
+        cursor = self.connection().execute(
+            "INSERT INTO jobs (name, payload, run_at, created_at) VALUES (?, ?, ?, ?)",
+            (name, json.dumps(payload), now + delay, now)
+        )
+        self.wakeup.set()
+        return cursor.lastrowid
+
+    async def submit(self, name: str, payload: dict, delay: float = 0):
+        """Persist a job without blocking the event loop, starting the workers if needed"""
+        self.start()
+        return await run_in_threadpool(self.enqueue, name, payload, delay)
+
+    def start(self):
+        """Start the worker threads, replacing any that have died"""
+        with self.start_lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            if not self.threads:
+                self.stopping.clear()
+            for index in range(len(self.threads), self.workers):
+                thread = threading.Thread(target=self.work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def claim(self):
+        """Atomically take the next due job, including ones whose lease has expired
+
+        For batch handlers every other queued job of the same name is taken too,
+        whether or not it is due yet.
+        """
+        conn = self.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """SELECT id, name, payload, attempts, created_at FROM jobs
+                   WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until < ?)
+                   ORDER BY run_at, id LIMIT 1""",
+                (now, now)
+            ).fetchall()
+            if rows and self.handlers.get(rows[0][1], (None, False))[1]:
+                rows += conn.execute(
+                    """SELECT id, name, payload, attempts, created_at FROM jobs
+                       WHERE status = 'queued' AND name = ? AND id != ?
+                       ORDER BY run_at, id LIMIT ?""",
+                    (rows[0][1], rows[0][0], JOB_BATCH_SIZE - 1)
+                ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                [(now + JOB_LEASE_SECONDS, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def work(self):
+        while not self.stopping.is_set():
             try:
-                with open(attachment_path, "rb") as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {os.path.basename(attachment_path)}'
-                    )
-                    msg.attach(part)
+                jobs = self.claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                jobs = []
+            if not jobs:
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                continue
+            try:
+                self.run(jobs)
             except Exception as e:
-                print(f"Failed to attach file: {e}")
+                # Keep the worker alive; the jobs run again once their lease expires
+                print(f"Job queue error running {jobs[0][1]}: {e}")
+
+    def run(self, jobs: list):
+        conn = self.connection()
+        name = jobs[0][1]
+        if name not in self.handlers:
+            # Queued before its handler was renamed or removed; no retry can run it
+            print(f"Job {name} #{jobs[0][0]} has no handler, marking it failed")
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?",
+                [(f"No handler registered for {name}", job[0]) for job in jobs]
+            )
+            with self.stats_lock:
+                self.failed += len(jobs)
+            return
+        fn, batch = self.handlers[name]
+        try:
+            if batch:
+                fn([json.loads(payload) for _, _, payload, _, _ in jobs])
+            else:
+                fn(**json.loads(jobs[0][2]))
+        except Exception as e:
+            for job_id, _, _, attempts, _ in jobs:
+                attempt = attempts + 1
+                if attempt >= JOB_MAX_ATTEMPTS or isinstance(e, PermanentJobError):
+                    print(f"Job {name} #{job_id} failed permanently: {e}")
+                    conn.execute("UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?", (str(e), job_id))
+                    with self.stats_lock:
+                        self.failed += 1
+                else:
+                    delay = JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1) + random.uniform(0, JOB_RETRY_BASE_SECONDS)
+                    print(f"Job {name} #{job_id} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', run_at = ?, last_error = ? WHERE id = ?",
+                        (time.time() + delay, str(e), job_id)
+                    )
+                    with self.stats_lock:
+                        self.retried += 1
+            return
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job[0],) for job in jobs])
+        with self.stats_lock:
+            self.processed += len(jobs)
+            self.latencies.extend(time.time() - job[4] for job in jobs)
+
+    def stats(self):
+        conn = self.connection()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            processed, retried, failed = self.processed, self.retried, self.failed
+        return {
+            "workers": sum(thread.is_alive() for thread in self.threads),
+            "queue_depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "failed_jobs": counts.get("failed", 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else None,
+            "processed": processed,
+            "retried": retried,
+            "failed": failed,
+            "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None
+        }
+
+job_queue = JobQueue(JOB_DB_PATH, JOB_WORKERS)
+
+@job_queue.handler("image_variants")
+def image_variants_job(key: str, variants: dict):
+    create_image_variants(key, variants)
+    # Products only advertise derivatives once they exist; publish them to any saved before now
+    execute_query(table("products").update({"image_variants": variants}).eq("image_url", f"/uploads/{key}"))
+    catalog.invalidate()
+
+# Payment receipt notifications are held for NOTIFY_DIGEST_SECONDS so a burst
+# of uploads reaches the admin as one digest email instead of one per receipt.
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", "60"))
+
+def receipt_summary(receipt: dict, order: Optional[dict], attached: bool = True):
+    note = "" if attached else " (too large to attach - open it from the admin payment uploads page)"
+    return f"""
+        Order Details:
+        - Order ID: {receipt['order_id']}
+        - Customer Email: {receipt['email']}
+        - Total Amount: ₹{order['total_amount'] if order else 'unknown'}
+        - Upload Time: {receipt['uploaded_at']}
         
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_username, to_email, text)
-        server.quit()
+        Customer Notes: {receipt['notes'] if receipt['notes'] else 'None'}
         
-        print(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
+        Receipt file: {receipt['filename']}{note}
+        """
+
+def split_receipt_digest(receipts: List[dict]):
+    """Take receipts in order until their files would exceed SMTP_MAX_ATTACHMENT_BYTES
+
+    Returns the receipts for this digest, the filenames to attach and the
+    receipts left for the next one. A file over the limit on its own is
+    listed without being attached.
+    """
+    storage = get_upload_storage()
+    digest, attached, total = [], [], 0
+    for receipt in receipts:
+        # Identical uploads share one stored file, which is attached once
+        key = receipt["filename"]
+        size = 0 if key in attached else storage.size(key)
+        attach = size is not None and size <= SMTP_MAX_ATTACHMENT_BYTES
+        if attach and digest and total + size > SMTP_MAX_ATTACHMENT_BYTES:
+            break
+        digest.append(receipt)
+        if attach and key not in attached:
+            attached.append(key)
+            total += size
+    return digest, attached, receipts[len(digest):]
+
+@job_queue.handler("payment_receipt_email", batch=True)
+def payment_receipt_email_job(receipts: List[dict]):
+    receipts, attached, rest = split_receipt_digest(receipts)
+    # Runs on a worker thread, so the query can execute synchronously
+    order_ids = sorted({receipt["order_id"] for receipt in receipts})
+    order_result = execute_query(table("orders").select("id, total_amount").in_("id", order_ids))
+    orders = {order["id"]: order for order in order_result.data}
+    attachments = ExitStack()
+    
+    if len(receipts) == 1:
+        receipt = receipts[0]
+        subject = f"New Payment Receipt Uploaded - Order #{receipt['order_id']}"
+        body = f"""
+        A new payment receipt has been uploaded for Order #{receipt['order_id']}.
+        {receipt_summary(receipt, orders.get(receipt['order_id']), receipt['filename'] in attached)}
+        Please review the payment receipt and update the order status accordingly.
+        """
+    else:
+        subject = f"{len(receipts)} New Payment Receipts Uploaded"
+        body = f"""
+        {len(receipts)} new payment receipts have been uploaded.
+        {"".join(receipt_summary(receipt, orders.get(receipt['order_id']), receipt['filename'] in attached) for receipt in receipts)}
+        Please review the payment receipts and update the order statuses accordingly.
+        """
+    with attachments:
+        paths = [str(attachments.enter_context(get_upload_storage().local_copy(filename))) for filename in attached]
+        deliver_email(ADMIN_EMAIL or "admin@shop.com", subject, body, paths)
+    # Receipts that did not fit go out in the next digest, sent as soon as a worker picks them up
+    for receipt in rest:
+        job_queue.enqueue("payment_receipt_email", receipt)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    job_queue.stop()
+    smtp_transport.close()
+    supabase_pool.close()
+
+# Payment uploads listing
+# The admin list is paged with a keyset cursor on (upload_time, id), served by
+# the composite indexes in database_setup.sql, so every page costs the same no
+# matter how much history has accumulated.
+PAYMENT_STATUSES = ("pending", "approved", "rejected")
+PAYMENT_UPLOADS_PAGE_SIZE = int(os.getenv("PAYMENT_UPLOADS_PAGE_SIZE", "20"))
+PAYMENT_UPLOADS_MAX_PAGE_SIZE = 100
+PAYMENT_UPLOAD_COLUMNS = "id, order_id, user_email, file_path, upload_time, status, admin_notes, orders(total_amount, status)"
+
+def or_filter(query, expression: str):
+    """Add a PostgREST or=(...) filter; this postgrest-py release has no or_()"""
+    query.params = query.params.add("or", f"({expression})")
+    return query
+
+def encode_cursor(row: dict):
+    return base64.urlsafe_b64encode(json.dumps([row["upload_time"], row["id"]]).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    """(upload_time, id) from a cursor returned by get_payment_uploads"""
+    try:
+        upload_time, upload_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # upload_time is interpolated into a filter, so it must be a plain timestamp
+        datetime.fromisoformat(upload_time)
+        return upload_time, int(upload_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Order pricing
+# Prices always come from the database, never from the client or a catalog
+# cache that may lag behind it, and use exact decimal arithmetic to match the
+# DECIMAL(10, 2) columns.
+CENT = Decimal("0.01")
+
+def to_money(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+async def price_order(items: List[OrderItem]):
+    """Price order lines at current database prices, returning (lines, total)"""
+    if not items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    products = await catalog.get_fresh([item.product_id for item in items])
+    lines = []
+    total = Decimal("0.00")
+    for item in items:
+        product = products.get(item.product_id)
+        if not product or not product.get("available"):
+            raise HTTPException(status_code=400, detail=f"Product {item.product_id} is not available")
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be positive")
+        price = to_money(product["price"])
+        total += price * item.quantity
+        lines.append({"product_id": item.product_id, "quantity": item.quantity, "price": price})
+    return lines, total
+
+# Order creation
+# create_order_with_items (database_setup.sql) writes the order, all of its
+# items and clears the cart in one transaction and one round trip. Databases
+# without the function fall back to a bulk insert with a compensating delete.
+async def insert_order(email: str, total_amount: Decimal, items: List[dict]):
+    """Create an order with its items and clear the user's cart, returning the order id"""
+    # Decimals are sent as strings so PostgREST casts them to numeric exactly
+    total_amount = str(total_amount)
+    items = [{**item, "price": str(item["price"])} for item in items]
+
+    async def fallback():
+        order_result = await run_query(table("orders").insert({
+            "user_email": email,
+            "total_amount": total_amount,
+            "status": "pending",
+            "created_at": datetime.utcnow().isoformat()
+        }))
+        order_id = order_result.data[0]["id"]
+        try:
+            if items:
+                await run_query(table("order_items").insert([{**item, "order_id": order_id} for item in items]))
+        except Exception:
+            # Do not leave an order without its items behind
+            await run_query(table("orders").delete().eq("id", order_id))
+            raise
+        await run_query(table("cart").delete().eq("user_email", email))
+        return order_result.data
+
+    rows = await run_function("create_order_with_items", {
+        "p_user_email": email,
+        "p_total_amount": total_amount,
+        "p_items": items
+    }, fallback)
+    return rows[0]["id"]
+
+# Cart updates
+# apply_cart_deltas (database_setup.sql) adds quantity deltas with
+# INSERT ... ON CONFLICT against the (user_email, product_id) unique index,
+# so any number of lines is one atomic round trip.
+def merge_cart_deltas(items: List[CartItem]):
+    deltas = {}
+    for item in items:
+        deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+    return [{"product_id": product_id, "quantity": quantity} for product_id, quantity in deltas.items() if quantity]
+
+async def apply_cart_deltas(email: str, items: List[CartItem]):
+    """Add quantity deltas to the user's cart, dropping lines that reach zero"""
+    deltas = merge_cart_deltas(items)
+    if not deltas:
+        return []
+
+    async def fallback():
+        rows = []
+        for delta in deltas:
+            existing = await run_query(table("cart").select("*").eq("user_email", email).eq("product_id", delta["product_id"]))
+            if existing.data:
+                new_quantity = existing.data[0]["quantity"] + delta["quantity"]
+                if new_quantity <= 0:
+                    await run_query(table("cart").delete().eq("id", existing.data[0]["id"]))
+                    continue
+                result = await run_query(table("cart").update({"quantity": new_quantity}).eq("id", existing.data[0]["id"]))
+            elif delta["quantity"] > 0:
+                result = await run_query(table("cart").insert({"user_email": email, **delta}))
+            else:
+                continue
+            rows.extend(result.data)
+        return rows
+
+    return await run_function("apply_cart_deltas", {"p_user_email": email, "p_items": deltas}, fallback)
+
+# Cart reads
+# Cart lines are read as (id, product_id, quantity) rows with only the current
+# price embedded, and joined with the cached catalog in-process for names and
+# images instead of embedding full product rows. Totals therefore match what
+# checkout charges on any worker. The ETag is derived from the joined cart, so
+# an unchanged cart at unchanged prices revalidates with a 304 on any worker.
+CART_PRODUCT_FIELDS = ("id", "name", "image_url")
+
+async def load_cart(email: str):
+    """The user's cart lines with product summaries, subtotals and total"""
+    result = await run_query(table("cart").select("id, product_id, quantity, products(price)").eq("user_email", email).order("id"))
+    products = await catalog.get_many([row["product_id"] for row in result.data])
+    items = []
+    total = Decimal("0.00")
+    stale = False
+    for row in result.data:
+        product = products.get(row["product_id"])
+        current = row["products"]
+        if current is None or product is None:
+            # Deleted products cannot be ordered, so their lines are not shown
+            stale = stale or product is not None
+            continue
+        price = to_money(current["price"])
+        stale = stale or price != to_money(product["price"])
+        subtotal = price * row["quantity"]
+        total += subtotal
+        items.append({
+            "id": row["id"],
+            "product_id": row["product_id"],
+            "quantity": row["quantity"],
+            "products": {**{field: product.get(field) for field in CART_PRODUCT_FIELDS}, "price": current["price"]},
+            "subtotal": float(subtotal)
+        })
+    if stale:
+        # Changed elsewhere since this worker loaded its catalog
+        catalog.invalidate()
+    return {"items": items, "count": sum(item["quantity"] for item in items), "total": float(total)}
+
+# Payment review
+# set_payment_status (database_setup.sql) updates the uploads and, on
+# approval, confirms their orders in one statement and one round trip.
+# Databases without the function fall back to two bulk updates.
+PAYMENT_APPROVAL_MAX_IDS = 500
+
+async def set_payment_status(upload_ids: List[int], status: str, admin_notes: Optional[str] = None):
+    """Set the status of payment uploads, returning their new state with the order status"""
+    if status not in PAYMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of: {', '.join(PAYMENT_STATUSES)}")
+    upload_ids = sorted(set(upload_ids))
+    if not upload_ids:
+        return []
+
+    async def fallback():
+        changes = {"status": status}
+        if admin_notes is not None:
+            changes["admin_notes"] = admin_notes
+        result = await run_query(table("payment_uploads").update(changes).in_("id", upload_ids))
+        order_ids = sorted({row["order_id"] for row in result.data if row.get("order_id")})
+        if status == "approved" and order_ids:
+            await run_query(table("orders").update({"status": "confirmed"}).in_("id", order_ids))
+        return [
+            {
+                "id": row["id"],
+                "order_id": row["order_id"],
+                "status": row["status"],
+                "admin_notes": row.get("admin_notes"),
+                "order_status": "confirmed" if status == "approved" else None
+            }
+            for row in result.data
+        ]
+
+    return await run_function("set_payment_status", {
+        "p_upload_ids": upload_ids,
+        "p_status": status,
+        "p_admin_notes": admin_notes
+    }, fallback)
 
 # Routes
+@app.get("/metrics")
+async def get_metrics():
+    """Request latency and backend call metrics in Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
+    # The job queue is SQLite on disk, which may block on a busy database
+    jobs = await run_in_threadpool(job_queue.stats)
     return {
         "status": "healthy",
-        "supabase_connected": supabase is not None,
+        "supabase_connected": get_supabase() is not None,
         "dependencies": {
             "supabase": SUPABASE_AVAILABLE,
             "jwt": JWT_AVAILABLE,
             "bcrypt": BCRYPT_AVAILABLE,
             "pil": PIL_AVAILABLE
         },
+        "catalog_cache": catalog.stats(),
+        "single_flight": single_flight.stats(),
+        "password_pool": password_pool_stats.snapshot(),
+        "token_cache": token_cache.stats(),
+        "supabase_pool": supabase_pool.stats(),
+        "jobs": jobs,
+        "smtp": smtp_transport.stats(),
         "environment_vars": {
             "SUPABASE_URL": bool(os.getenv("SUPABASE_URL")),
             "SUPABASE_KEY": bool(os.getenv("SUPABASE_KEY")),
@@ -310,27 +2143,33 @@ async def health_check():
     }
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
-    return FileResponse("frontend/index.html")
+async def read_root(request: Request):
+    # Prefer the build output, which references content-hashed assets
+    asset = static_index.get("dist/index.html") or static_index.get("index.html")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return static_response(request, asset, cache_control="no-cache")
 
 @app.post("/api/register")
 async def register(user: UserCreate):
     try:
         # Check if user exists
-        existing_user = supabase.table("users").select("*").eq("email", user.email).execute()
+        existing_user = await run_query(table("users").select("*").eq("email", user.email))
         if existing_user.data:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create user
-        hashed_password = hash_password(user.password)
-        result = supabase.table("users").insert({
+        hashed_password = await run_password_task(hash_password, user.password)
+        result = await run_query(table("users").insert({
             "email": user.email,
             "password": hashed_password,
             "name": user.name,
             "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        }))
         
         return {"message": "User registered successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -338,44 +2177,71 @@ async def register(user: UserCreate):
 async def login(user: UserLogin):
     try:
         # Check admin login
-        if user.email == os.getenv("ADMIN_EMAIL") and user.password == os.getenv("ADMIN_PASSWORD"):
+        if user.email == ADMIN_EMAIL and user.password == os.getenv("ADMIN_PASSWORD"):
             access_token = create_access_token(data={"sub": user.email, "role": "admin"})
             return {"access_token": access_token, "token_type": "bearer", "role": "admin"}
         
         # Check regular user
-        db_user = supabase.table("users").select("*").eq("email", user.email).execute()
-        if not db_user.data or not verify_password(user.password, db_user.data[0]["password"]):
+        db_user = await run_query(table("users").select("*").eq("email", user.email))
+        if not db_user.data or not await run_password_task(verify_password, user.password, db_user.data[0]["password"]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         access_token = create_access_token(data={"sub": user.email, "role": "user"})
         return {"access_token": access_token, "token_type": "bearer", "role": "user"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/products")
-async def get_products():
+async def get_products(
+    response: Response,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0
+):
+    """Available products, optionally searched, filtered, sorted and paged"""
     try:
-        if not supabase:
-            raise HTTPException(status_code=500, detail="Database not available")
-        result = supabase.table("products").select("*").eq("available", True).execute()
-        return result.data
+        if sort is not None and sort not in PRODUCT_SORTS:
+            raise HTTPException(status_code=400, detail=f"Sort must be one of: {', '.join(PRODUCT_SORTS)}")
+        if not any([q, category, sort, min_price is not None, max_price is not None, limit is not None, offset]):
+            return await catalog.list_available()
+        
+        results = await catalog.search(q, category, min_price, max_price, sort)
+        # The body stays a plain list; the total for paging goes in a header
+        response.headers["X-Total-Count"] = str(len(results))
+        offset = max(offset, 0)
+        if limit is None:
+            return results[offset:]
+        return results[offset:offset + max(1, min(limit, 100))]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/products/{product_id}")
 async def get_product(product_id: int):
     try:
-        result = supabase.table("products").select("*").eq("id", product_id).execute()
-        if not result.data:
+        product = await catalog.get(product_id)
+        if not product:
             raise HTTPException(status_code=404, detail="Product not found")
-        return result.data[0]
+        return product
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/admin/products")
 async def create_product(product: Product, admin_email: str = Depends(verify_admin)):
     try:
-        result = supabase.table("products").insert(product.dict()).execute()
+        product_data = product.dict()
+        product_data["image_variants"] = await run_in_threadpool(ready_image_variants, product.image_url)
+        result = await run_query(table("products").insert(product_data))
+        catalog.put(result.data[0])
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -383,8 +2249,13 @@ async def create_product(product: Product, admin_email: str = Depends(verify_adm
 @app.put("/api/admin/products/{product_id}")
 async def update_product(product_id: int, product: ProductUpdate, admin_email: str = Depends(verify_admin)):
     try:
-        update_data = {k: v for k, v in product.dict().items() if v is not None}
-        result = supabase.table("products").update(update_data).eq("id", product_id).execute()
+        update_data = {k: v for k, v in product.dict(exclude_unset=True).items() if v is not None}
+        update_data.pop("image_variants", None)
+        if "image_url" in update_data:
+            # A new image never keeps the previous image's derivatives
+            update_data["image_variants"] = await run_in_threadpool(ready_image_variants, update_data["image_url"])
+        result = await run_query(table("products").update(update_data).eq("id", product_id))
+        catalog.put(result.data[0])
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -392,7 +2263,8 @@ async def update_product(product_id: int, product: ProductUpdate, admin_email: s
 @app.delete("/api/admin/products/{product_id}")
 async def delete_product(product_id: int, admin_email: str = Depends(verify_admin)):
     try:
-        supabase.table("products").delete().eq("id", product_id).execute()
+        await run_query(table("products").delete().eq("id", product_id))
+        catalog.remove(product_id)
         return {"message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -409,90 +2281,88 @@ async def upload_image(file: UploadFile = File(...), admin_email: str = Depends(
         if file_extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
             raise HTTPException(status_code=400, detail="Unsupported image format")
         
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
+        # Save uploaded file; a repeated image reuses the stored copy and its derivatives
+        unique_filename, created = await save_upload(file, file_extension)
         
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Optimize image (resize if too large)
+        # Derivatives are written by a background job, which publishes them to the
+        # products using this image; until then the original is served
+        image_url = f"/uploads/{unique_filename}"
+        image_variants = None
         if PIL_AVAILABLE:
             try:
-                with Image.open(file_path) as img:
-                    # Convert to RGB if necessary
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Resize if image is too large
-                    max_size = (800, 600)
-                    if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                        # Use LANCZOS for older Pillow versions, LANCZOS for newer ones
-                        try:
-                            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                        except AttributeError:
-                            img.thumbnail(max_size, Image.LANCZOS)
-                        img.save(file_path, optimize=True, quality=85)
+                await file.seek(0)
+                planned = await run_in_threadpool(plan_image_variants, file.file, Path(unique_filename).stem)
+                if await run_in_threadpool(variants_stored, planned):
+                    image_variants = planned
+                else:
+                    await job_queue.submit("image_variants", {"key": unique_filename, "variants": planned})
             except Exception as e:
                 print(f"Image optimization failed: {e}")
         else:
             print("PIL not available - skipping image optimization")
         
-        # Return the URL path
-        image_url = f"/uploads/{unique_filename}"
-        return {"image_url": image_url}
+        return {"image_url": image_url, "image_variants": image_variants}
         
     except Exception as e:
-        # Clean up file if it was created
-        if 'file_path' in locals() and file_path.exists():
-            file_path.unlink()
+        # Clean up file if this request created it; identical uploads share it
+        if locals().get('created'):
+            get_upload_storage().delete(unique_filename)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/cart/add")
 async def add_to_cart(item: CartItem, email: str = Depends(verify_token)):
     try:
-        # Check if item already in cart
-        existing = supabase.table("cart").select("*").eq("user_email", email).eq("product_id", item.product_id).execute()
-        
-        if existing.data:
-            # Update quantity
-            new_quantity = existing.data[0]["quantity"] + item.quantity
-            result = supabase.table("cart").update({"quantity": new_quantity}).eq("id", existing.data[0]["id"]).execute()
-        else:
-            # Add new item
-            result = supabase.table("cart").insert({
-                "user_email": email,
-                "product_id": item.product_id,
-                "quantity": item.quantity
-            }).execute()
-        
+        await apply_cart_deltas(email, [item])
         return {"message": "Item added to cart"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/cart/items")
+async def update_cart_items(update: CartUpdate, email: str = Depends(verify_token)):
+    try:
+        rows = await apply_cart_deltas(email, update.items)
+        return {"message": "Cart updated", "items": rows}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/cart")
-async def get_cart(email: str = Depends(verify_token)):
+async def get_cart(request: Request, email: str = Depends(verify_token)):
     try:
-        result = supabase.table("cart").select("*, products(*)").eq("user_email", email).execute()
-        return result.data
+        body = json.dumps(await load_cart(email), separators=(",", ":"))
+        etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/api/cart/{item_id}")
 async def remove_from_cart(item_id: int, email: str = Depends(verify_token)):
     try:
-        supabase.table("cart").delete().eq("id", item_id).eq("user_email", email).execute()
+        await run_query(table("cart").delete().eq("id", item_id).eq("user_email", email))
         return {"message": "Item removed from cart"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/api/settings")
+async def get_settings(request: Request):
+    """Contact, payment and company info in one response for page bootstrap"""
+    try:
+        values = await settings_store.get_all()
+        headers = {"ETag": settings_store.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), settings_store.etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(values, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/contact")
 async def get_contact_info():
     try:
-        result = supabase.table("settings").select("*").eq("key", "contact_info").execute()
-        if result.data:
-            return json.loads(result.data[0]["value"])
-        return {"email": "contact@brownieshop.com", "phone": "+91-9876543210", "address": "123 Brownie St"}
+        return await settings_store.get("contact_info")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -500,11 +2370,12 @@ async def get_contact_info():
 async def update_contact_info(contact: ContactInfo, admin_email: str = Depends(verify_admin)):
     try:
         # Use upsert with match to handle the unique constraint properly
-        result = supabase.table("settings").upsert({
+        result = await run_query(table("settings").upsert({
             "key": "contact_info",
             "value": json.dumps(contact.dict()),
             "updated_at": datetime.utcnow().isoformat()
-        }, on_conflict="key").execute()
+        }, on_conflict="key"))
+        settings_store.put("contact_info", contact.dict())
         return {"message": "Contact info updated"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -512,21 +2383,19 @@ async def update_contact_info(contact: ContactInfo, admin_email: str = Depends(v
 @app.get("/api/payment-info")
 async def get_payment_info():
     try:
-        result = supabase.table("settings").select("*").eq("key", "payment_info").execute()
-        if result.data:
-            return json.loads(result.data[0]["value"])
-        return {"qr_code_url": "", "payment_email": "payments@brownieshop.com"}
+        return await settings_store.get("payment_info")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/api/admin/payment-info")
 async def update_payment_info(payment: PaymentInfo, admin_email: str = Depends(verify_admin)):
     try:
-        result = supabase.table("settings").upsert({
+        result = await run_query(table("settings").upsert({
             "key": "payment_info",
             "value": json.dumps(payment.dict()),
             "updated_at": datetime.utcnow().isoformat()
-        }, on_conflict="key").execute()
+        }, on_conflict="key"))
+        settings_store.put("payment_info", payment.dict())
         return {"message": "Payment info updated"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -534,21 +2403,19 @@ async def update_payment_info(payment: PaymentInfo, admin_email: str = Depends(v
 @app.get("/api/company-info")
 async def get_company_info():
     try:
-        result = supabase.table("settings").select("*").eq("key", "company_info").execute()
-        if result.data:
-            return json.loads(result.data[0]["value"])
-        return {"name": "AniAthu's brownies", "tagline": "Premium Handcrafted Brownies"}
+        return await settings_store.get("company_info")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/api/admin/company-info")
 async def update_company_info(company: CompanyInfo, admin_email: str = Depends(verify_admin)):
     try:
-        result = supabase.table("settings").upsert({
+        result = await run_query(table("settings").upsert({
             "key": "company_info",
             "value": json.dumps(company.dict()),
             "updated_at": datetime.utcnow().isoformat()
-        }, on_conflict="key").execute()
+        }, on_conflict="key"))
+        settings_store.put("company_info", company.dict())
         return {"message": "Company info updated"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -556,29 +2423,14 @@ async def update_company_info(company: CompanyInfo, admin_email: str = Depends(v
 @app.post("/api/create-order")
 async def create_order(order: OrderCreate, email: str = Depends(verify_token)):
     try:
-        # Create order
-        order_result = supabase.table("orders").insert({
-            "user_email": email,
-            "total_amount": order.total_amount,
-            "status": "pending",
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
-        
-        order_id = order_result.data[0]["id"]
-        
-        # Create order items
-        for item in order.items:
-            supabase.table("order_items").insert({
-                "order_id": order_id,
-                "product_id": item["product_id"],
-                "quantity": item["quantity"],
-                "price": item["price"]
-            }).execute()
-        
-        # Clear cart
-        supabase.table("cart").delete().eq("user_email", email).execute()
-        
-        return {"order_id": order_id, "message": "Order created successfully"}
+        items, total_amount = await price_order(order.items)
+        # A client total that no longer matches means prices changed since the cart was shown
+        if order.total_amount is not None and to_money(order.total_amount) != total_amount:
+            raise HTTPException(status_code=409, detail="Product prices have changed, please review your cart")
+        order_id = await insert_order(email, total_amount, items)
+        return {"order_id": order_id, "total_amount": float(total_amount), "message": "Order created successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -599,67 +2451,71 @@ async def upload_payment_receipt(
         if file_extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
             raise HTTPException(status_code=400, detail="Unsupported image format")
         
-        unique_filename = f"payment_{order_id}_{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
         # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        unique_filename, created = await save_upload(file, file_extension, prefix="payment_")
         
         # Save to database
-        upload_result = supabase.table("payment_uploads").insert({
+        upload_result = await run_query(table("payment_uploads").insert({
             "order_id": order_id,
             "user_email": email,
             "file_path": f"/uploads/{unique_filename}",
             "upload_time": datetime.utcnow().isoformat(),
             "status": "pending"
-        }).execute()
-        
-        # Get order details for email
-        order_result = supabase.table("orders").select("*").eq("id", order_id).execute()
-        if not order_result.data:
-            raise HTTPException(status_code=404, detail="Order not found")
-        
-        order = order_result.data[0]
-        
-        # Send email to admin
-        admin_email = os.getenv("ADMIN_EMAIL", "admin@shop.com")
-        subject = f"New Payment Receipt Uploaded - Order #{order_id}"
-        body = f"""
-        A new payment receipt has been uploaded for Order #{order_id}.
+        }))
+        # The upload row now references the file, so it must never be cleaned up below
+        created = False
         
-        Order Details:
-        - Order ID: {order_id}
-        - Customer Email: {email}
-        - Total Amount: ₹{order['total_amount']}
-        - Upload Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}
-        
-        Customer Notes: {notes if notes else 'None'}
-        
-        Please review the payment receipt and update the order status accordingly.
-        
-        Receipt file: {unique_filename}
-        """
-        
-        # Send email notification (non-blocking)
+        # Notify the admin from a background job so the customer is not kept waiting on SMTP;
+        # like a failed email, a failed notification does not fail the recorded upload
         try:
-            send_email(admin_email, subject, body, str(file_path))
+            await job_queue.submit("payment_receipt_email", {
+                "order_id": order_id,
+                "email": email,
+                "notes": notes,
+                "filename": unique_filename,
+                "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            }, delay=NOTIFY_DIGEST_SECONDS)
         except Exception as e:
-            print(f"Email notification failed, but upload was successful: {e}")
+            print(f"Failed to queue payment receipt notification for order {order_id}: {e}")
         
         return {"message": "Payment receipt uploaded successfully", "upload_id": upload_result.data[0]["id"]}
         
     except Exception as e:
-        # Clean up file if it was created
-        if 'file_path' in locals() and file_path.exists():
-            file_path.unlink()
+        # Clean up file if this request created it; identical uploads share it
+        if locals().get('created'):
+            get_upload_storage().delete(unique_filename)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/admin/payment-uploads")
-async def get_payment_uploads(admin_email: str = Depends(verify_admin)):
+async def get_payment_uploads(
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PAYMENT_UPLOADS_PAGE_SIZE,
+    admin_email: str = Depends(verify_admin)
+):
+    """Newest-first page of payment uploads with an opaque cursor for the next page"""
     try:
-        result = supabase.table("payment_uploads").select("*, orders(*)").order("upload_time", desc=True).execute()
-        return result.data
+        if status is not None and status not in PAYMENT_STATUSES:
+            raise HTTPException(status_code=400, detail=f"Status must be one of: {', '.join(PAYMENT_STATUSES)}")
+        limit = max(1, min(limit, PAYMENT_UPLOADS_MAX_PAGE_SIZE))
+        
+        query = table("payment_uploads").select(PAYMENT_UPLOAD_COLUMNS)
+        if status:
+            query = query.eq("status", status)
+        if cursor:
+            upload_time, upload_id = decode_cursor(cursor)
+            # Rows strictly after the cursor in (upload_time DESC, id DESC) order
+            query = or_filter(query, f'upload_time.lt."{upload_time}",and(upload_time.eq."{upload_time}",id.lt.{upload_id})')
+        # One extra row tells whether another page exists
+        result = await run_query(query.order("upload_time", desc=True).order("id", desc=True).limit(limit + 1))
+        
+        items = result.data[:limit]
+        next_cursor = encode_cursor(items[-1]) if len(result.data) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -671,24 +2527,65 @@ async def update_payment_status(
     admin_email: str = Depends(verify_admin)
 ):
     try:
-        # Update payment upload status
-        result = supabase.table("payment_uploads").update({
-            "status": status,
-            "admin_notes": admin_notes
-        }).eq("id", upload_id).execute()
+        # Update the upload and, when approved, confirm its order
+        rows = await set_payment_status([upload_id], status, admin_notes)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Payment upload not found")
         
-        if status == "approved":
-            # Get upload details to update order
-            upload_result = supabase.table("payment_uploads").select("*, orders(*)").eq("id", upload_id).execute()
-            if upload_result.data:
-                order_id = upload_result.data[0]["order_id"]
-                # Update order status
-                supabase.table("orders").update({"status": "confirmed"}).eq("id", order_id).execute()
-        
-        return {"message": "Payment status updated"}
+        return {"message": "Payment status updated", "upload": rows[0]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/admin/payment-uploads/approve")
+async def approve_payment_uploads(approval: PaymentApproval, admin_email: str = Depends(verify_admin)):
+    """Approve many payment uploads and confirm their orders in one call"""
+    try:
+        if len(approval.upload_ids) > PAYMENT_APPROVAL_MAX_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {PAYMENT_APPROVAL_MAX_IDS} uploads can be approved at once")
+        rows = await set_payment_status(approval.upload_ids, "approved", approval.admin_notes)
+        return {"message": f"{len(rows)} payment uploads approved", "uploads": rows}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def warm_up():
+    """Create the Supabase client and import the modules deferred for cold starts"""
+    get_supabase()
+    get_upload_storage()
+    if PIL_AVAILABLE:
+        import PIL.Image
+    import smtplib
+    import email.mime.multipart
+
+if STARTUP_MODE == "eager":
+    warm_up()
+
+async def warm_caches():
+    """Load the product catalog and settings ahead of the first request"""
+    await asyncio.gather(catalog.ensure_loaded(), settings_store.ensure_loaded())
+
+def reset_connections():
+    """Close the Supabase connections, upload storage client and database threads; all are recreated on next use
+
+    A preloading server calls this in its master process after warming the
+    caches, so the workers it forks inherit the caches but not its sockets
+    and threads.
+    """
+    global supabase, supabase_initialized, supabase_pool, db_executor, db_semaphore, upload_storage
+    with upload_storage_lock:
+        upload_storage = None
+    with supabase_lock:
+        supabase_pool.close()
+        supabase_pool = SupabasePool()
+        supabase = None
+        supabase_initialized = False
+    db_executor.shutdown(wait=True)
+    db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="supabase")
+    db_semaphore = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+
 # For Vercel deployment
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark.
+
+Starts a fresh interpreter per run with `python -X importtime`, imports app.py
+and serves one GET request (by default /api/products, backed by the fake
+PostgREST) the way a serverless instance handles its first request. Reports
+the process, import and first request times per STARTUP_MODE along with the
+heaviest modules app.py pulls in at import time. Lazy startup moves the
+Supabase import into the first request that queries the database, so compare
+a database route with one that is not (e.g. --path /) to see both sides.
+
+    python benchmarks/cold_start.py --modes lazy eager --runs 5
+    python benchmarks/cold_start.py --path /
+    python benchmarks/cold_start.py --vercel --output cold_start.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import REPO_ROOT, percentile
+from fake_postgrest import FakePostgREST, sample_products
+
+# Runs in the child interpreter: time the import, then one request straight through ASGI
+CHILD = """
+import asyncio, json, os, time
+path = os.environ["COLD_START_PATH"]
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+async def first_request():
+    messages, requested, finished = [], [], asyncio.Event()
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+    async def send(message):
+        messages.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"benchmark")], "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+    }
+    await app.app(scope, receive, send)
+    return messages[0]["status"]
+
+status = asyncio.run(first_request())
+print(json.dumps({"import_ms": (imported - started) * 1000, "request_ms": (time.perf_counter() - imported) * 1000, "status": status}))
+"""
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+def heaviest_imports(stderr: str, top: int):
+    """Cumulative import time of the modules imported directly by app.py"""
+    children = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if depth == 1:
+            if name == "app":
+                break
+            children = []
+        elif depth == 3:
+            children.append((name, cumulative))
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in sorted(children, key=lambda child: -child[1])[:top]]
+
+def cold_start(mode: str, path: str, supabase_url: str, job_dir: str, vercel: bool):
+    env = {
+        **os.environ,
+        "STARTUP_MODE": mode,
+        "COLD_START_PATH": path,
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_KEY": "benchmark.anon.key",
+        "SECRET_KEY": "benchmark-secret",
+        "JOB_DB_PATH": str(Path(job_dir) / "jobs.sqlite3"),
+    }
+    if vercel:
+        env["VERCEL"] = "1"
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=REPO_ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+    process_ms = (time.perf_counter() - started) * 1000
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return process_ms, result, completed.stderr
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["lazy", "eager"], default=["lazy", "eager"])
+    parser.add_argument("--path", default="/api/products", help="route requested after the import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    parser.add_argument("--vercel", action="store_true", help="set VERCEL=1 so .env is not read")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    backend = FakePostgREST(latency_ms=args.latency_ms)
+    backend.seed("products", sample_products())
+    supabase_url = backend.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as job_dir:
+            for mode in args.modes:
+                process_ms, import_ms, request_ms = [], [], []
+                for _ in range(args.runs):
+                    elapsed, result, stderr = cold_start(mode, args.path, supabase_url, job_dir, args.vercel)
+                    if result["status"] != 200:
+                        raise SystemExit(f"GET {args.path} returned {result['status']} in {mode} mode")
+                    process_ms.append(elapsed)
+                    import_ms.append(result["import_ms"])
+                    request_ms.append(result["request_ms"])
+                results.append({
+                    "mode": mode,
+                    "process_p50_ms": round(percentile(process_ms, 50), 1),
+                    "import_p50_ms": round(percentile(import_ms, 50), 1),
+                    "first_request_p50_ms": round(percentile(request_ms, 50), 1),
+                    "import_plus_request_p50_ms": round(percentile([a + b for a, b in zip(import_ms, request_ms)], 50), 1),
+                    "heaviest_imports": heaviest_imports(stderr, args.top),
+                })
+    finally:
+        backend.stop()
+
+    report = {"path": args.path, "runs": args.runs, "vercel": args.vercel, "backend_latency_ms": args.latency_ms, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
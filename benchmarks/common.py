@@ -0,0 +1,31 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+
+import importlib
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def load_app(supabase_url: str, **env):
+    """Import app.py against a fake Supabase backend and return the module"""
+    os.environ["SUPABASE_URL"] = supabase_url
+    os.environ.setdefault("SUPABASE_KEY", "benchmark.anon.key")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ADMIN_EMAIL", "admin@brownieshop.com")
+    os.environ.setdefault("ADMIN_PASSWORD", "admin123")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    os.chdir(REPO_ROOT)
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    return importlib.import_module("app")
+
+def percentile(samples: list, pct: float):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Event loop responsiveness benchmark.
+
+Fires concurrent GET /api/cart requests at app.py (backed by a fake
+PostgREST with injected latency) while a heartbeat task measures how late the
+event loop wakes it up. Unlike the cached product list, every cart read
+queries the database. With queries offloaded to the database thread pool the
+lag stays near zero; --inline reproduces the old behaviour of calling
+execute() directly on the loop for comparison.
+
+    python benchmarks/event_loop_lag.py --requests 200 --concurrency 50
+    python benchmarks/event_loop_lag.py --inline
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from common import load_app, percentile
+from fake_postgrest import FakePostgREST, sample_products
+
+SHOPPER = "shopper@example.com"
+
+async def heartbeat(samples: list, stop: asyncio.Event, interval: float = 0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+async def run(app_module, requests: int, concurrency: int):
+    lag_samples, latencies = [], []
+    stop = asyncio.Event()
+    limiter = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(app=app_module.app, base_url="http://benchmark") as client:
+        token = app_module.create_access_token({"sub": SHOPPER, "role": "user"})
+        headers = {"Authorization": f"Bearer {token}"}
+        # Load the catalog once so only the uncached cart query is measured
+        (await client.get("/api/products")).raise_for_status()
+
+        async def one_request():
+            async with limiter:
+                started = time.perf_counter()
+                response = await client.get("/api/cart", headers=headers)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        ticker = asyncio.create_task(heartbeat(lag_samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50), 2),
+        "latency_p99_ms": round(percentile(latencies, 99), 2),
+        "loop_lag_p99_ms": round(percentile(lag_samples, 99), 2),
+        "loop_lag_max_ms": round(max(lag_samples, default=0.0), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--inline", action="store_true", help="execute queries directly on the event loop")
+    args = parser.parse_args()
+
+    backend = FakePostgREST(latency_ms=args.latency_ms)
+    backend.seed("products", sample_products())
+    backend.seed("cart", [{"id": index, "user_email": SHOPPER, "product_id": index, "quantity": 1} for index in range(1, 6)])
+    app_module = load_app(backend.start())
+
+    if args.inline:
+        async def run_query_inline(query, timeout=None):
+            return query.execute()
+        app_module.run_query = run_query_inline
+
+    try:
+        result = asyncio.run(run(app_module, args.requests, args.concurrency))
+    finally:
+        backend.stop()
+    result["mode"] = "inline" if args.inline else "offloaded"
+    result["backend_latency_ms"] = args.latency_ms
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
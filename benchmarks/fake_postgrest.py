@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+In-memory PostgREST stand-in for benchmarks.
+
+Implements just enough of the PostgREST wire protocol used by supabase-py
+(select with embeds, filters, order/limit, insert/upsert, update, delete and
+rpc calls) on top of plain Python lists, with configurable per-request latency
+so benchmarks can reproduce a slow database without a real Supabase project.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+def coerce(value, raw: str):
+    """Convert a query string literal to the type of the stored value"""
+    if isinstance(value, bool):
+        return raw == "true"
+    if isinstance(value, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+def compare(value, op: str, raw: str):
+    if op == "is":
+        return value is None if raw == "null" else value == (raw == "true")
+    if value is None:
+        return False
+    if op == "in":
+        options = [item.strip('"') for item in raw.strip("()").split(",")]
+        return any(value == coerce(value, option) for option in options)
+    if op == "ilike":
+        needle = raw.replace("*", "").replace("%", "").lower()
+        return needle in str(value).lower()
+    target = coerce(value, raw)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = float(value)
+    return {
+        "eq": lambda: value == target,
+        "neq": lambda: value != target,
+        "gt": lambda: value > target,
+        "gte": lambda: value >= target,
+        "lt": lambda: value < target,
+        "lte": lambda: value <= target,
+    }[op]()
+
+def split_top_level(expression: str):
+    """Split a PostgREST logic expression on commas outside parentheses"""
+    parts, depth, current = [], 0, ""
+    for char in expression:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def matches_logic(row: dict, expression: str, conjunction: str):
+    results = []
+    for part in split_top_level(expression):
+        if part.startswith(("and(", "or(")):
+            inner_conjunction, inner = part.split("(", 1)
+            results.append(matches_logic(row, inner[:-1], inner_conjunction))
+        else:
+            column, op, raw = part.split(".", 2)
+            # Values containing reserved characters arrive double-quoted
+            if len(raw) > 1 and raw[0] == raw[-1] == '"':
+                raw = raw[1:-1]
+            results.append(compare(row.get(column), op, raw))
+    return all(results) if conjunction == "and" else any(results)
+
+class FakePostgREST:
+    """Threaded HTTP server holding tables in memory"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tables = {}
+        self.rpc_handlers = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._next_ids = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def seed(self, table_name: str, rows: list):
+        for row in rows:
+            self.insert(table_name, dict(row))
+
+    def insert(self, table_name: str, row: dict):
+        rows = self.tables.setdefault(table_name, [])
+        if "id" not in row:
+            self._next_ids[table_name] = self._next_ids.get(table_name, 0) + 1
+            row["id"] = self._next_ids[table_name]
+        else:
+            self._next_ids[table_name] = max(self._next_ids.get(table_name, 0), row["id"])
+        rows.append(row)
+        return row
+
+    def select(self, table_name: str, params: list):
+        filters = [(k, v) for k, v in params if k not in RESERVED_PARAMS]
+        rows = [row for row in self.tables.get(table_name, []) if self._matches(row, filters)]
+        options = dict((k, v) for k, v in params if k in RESERVED_PARAMS)
+        for clause in reversed(options.get("order", "").split(",") if options.get("order") else []):
+            column, _, direction = clause.partition(".")
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith("desc"))
+        offset = int(options.get("offset", 0))
+        if "limit" in options:
+            rows = rows[offset:offset + int(options["limit"])]
+        else:
+            rows = rows[offset:]
+        return [self._project(table_name, row, options.get("select", "*")) for row in rows]
+
+    def _matches(self, row: dict, filters: list):
+        for column, expression in filters:
+            if column in ("or", "and"):
+                if not matches_logic(row, expression[1:-1], column):
+                    return False
+                continue
+            negate = expression.startswith("not.")
+            op, _, raw = expression[4:].partition(".") if negate else expression.partition(".")
+            if compare(row.get(column), op, raw) == negate:
+                return False
+        return True
+
+    def _project(self, table_name: str, row: dict, select: str):
+        result = {}
+        for column in split_top_level(select.replace(" ", "")):
+            if "(" in column:
+                embed, inner = column[:-1].split("(", 1)
+                foreign_key = embed.rstrip("s") + "_id"
+                related = [other for other in self.tables.get(embed, []) if other.get("id") == row.get(foreign_key)]
+                result[embed] = self._project(embed, related[0], inner) if related else None
+            elif column == "*":
+                result.update(row)
+            else:
+                result[column] = row.get(column)
+        return result
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status: int, payload=None):
+                body = json.dumps(payload if payload is not None else []).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _prepare(self):
+                with fake.lock:
+                    fake.request_count += 1
+                delay = fake.latency_ms + random.uniform(0, fake.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000.0)
+                parsed = urlparse(self.path)
+                resource = parsed.path.split("/rest/v1/", 1)[-1]
+                params = parse_qsl(parsed.query, keep_blank_values=True)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                return resource, params, body
+
+            def do_GET(self):
+                resource, params, _ = self._prepare()
+                with fake.lock:
+                    rows = fake.select(resource, params)
+                self._respond(200, rows)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_POST(self):
+                resource, params, body = self._prepare()
+                if resource.startswith("rpc/"):
+                    handler = fake.rpc_handlers.get(resource[4:])
+                    if handler is None:
+                        self._respond(404, {"code": "PGRST202", "message": f"Could not find the function {resource[4:]}"})
+                        return
+                    try:
+                        with fake.lock:
+                            result = handler(fake, body or {})
+                    except Exception as e:
+                        self._respond(400, {"code": "P0001", "message": str(e)})
+                        return
+                    self._respond(200, result)
+                    return
+                rows = body if isinstance(body, list) else [body]
+                conflict = dict(params).get("on_conflict")
+                created = []
+                with fake.lock:
+                    for row in rows:
+                        existing = None
+                        if conflict:
+                            keys = conflict.split(",")
+                            existing = next((other for other in fake.tables.get(resource, [])
+                                             if all(other.get(k) == row.get(k) for k in keys)), None)
+                        if existing is not None:
+                            existing.update(row)
+                            created.append(dict(existing))
+                        else:
+                            created.append(dict(fake.insert(resource, dict(row))))
+                self._respond(201, created)
+
+            def do_PATCH(self):
+                resource, params, body = self._prepare()
+                with fake.lock:
+                    filters = [(k, v) for k, v in params if k not in RESERVED_PARAMS]
+                    updated = []
+                    for row in fake.tables.get(resource, []):
+                        if fake._matches(row, filters):
+                            row.update(body or {})
+                            updated.append(dict(row))
+                self._respond(200, updated)
+
+            def do_DELETE(self):
+                resource, params, _ = self._prepare()
+                with fake.lock:
+                    filters = [(k, v) for k, v in params if k not in RESERVED_PARAMS]
+                    rows = fake.tables.get(resource, [])
+                    removed = [row for row in rows if fake._matches(row, filters)]
+                    fake.tables[resource] = [row for row in rows if not fake._matches(row, filters)]
+                self._respond(200, removed)
+
+        return Handler
+
+# Python emulations of the Postgres functions in database_setup.sql. They run
+# under the server lock, which stands in for the function's transaction.
+def create_order_with_items(fake: FakePostgREST, params: dict):
+    order = fake.insert("orders", {
+        "user_email": params["p_user_email"],
+        "total_amount": params["p_total_amount"],
+        "status": "pending",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    })
+    for item in params["p_items"]:
+        fake.insert("order_items", {**item, "order_id": order["id"]})
+    fake.tables["cart"] = [row for row in fake.tables.get("cart", []) if row["user_email"] != params["p_user_email"]]
+    return [dict(order)]
+
+def apply_cart_deltas(fake: FakePostgREST, params: dict):
+    email = params["p_user_email"]
+    cart = fake.tables.setdefault("cart", [])
+    changed = []
+    for item in params["p_items"]:
+        row = next((row for row in cart if row["user_email"] == email and row["product_id"] == item["product_id"]), None)
+        if row is None:
+            row = fake.insert("cart", {"user_email": email, "product_id": item["product_id"], "quantity": 0})
+        row["quantity"] += item["quantity"]
+        changed.append(row)
+    fake.tables["cart"] = [row for row in fake.tables["cart"] if row["user_email"] != email or row["quantity"] > 0]
+    return [dict(row) for row in changed if row["quantity"] > 0]
+
+def set_payment_status(fake: FakePostgREST, params: dict):
+    orders = {order["id"]: order for order in fake.tables.get("orders", [])}
+    result = []
+    for upload in fake.tables.get("payment_uploads", []):
+        if upload["id"] not in params["p_upload_ids"]:
+            continue
+        upload["status"] = params["p_status"]
+        if params.get("p_admin_notes") is not None:
+            upload["admin_notes"] = params["p_admin_notes"]
+        order = orders.get(upload["order_id"])
+        if order and params["p_status"] == "approved":
+            order["status"] = "confirmed"
+        result.append({
+            "id": upload["id"],
+            "order_id": upload["order_id"],
+            "status": upload["status"],
+            "admin_notes": upload.get("admin_notes"),
+            "order_status": order["status"] if order else None
+        })
+    return result
+
+SHOP_FUNCTIONS = {
+    "create_order_with_items": create_order_with_items,
+    "apply_cart_deltas": apply_cart_deltas,
+    "set_payment_status": set_payment_status,
+}
+
+def register_shop_functions(fake: FakePostgREST, names=None):
+    for name, handler in SHOP_FUNCTIONS.items():
+        if names is None or name in names:
+            fake.rpc_handlers[name] = handler
+
+def sample_products(count: int = 24):
+    categories = ["brownie", "blondie", "cookie", "cake"]
+    return [
+        {
+            "id": index,
+            "name": f"Brownie #{index}",
+            "description": "Rich and fudgy chocolate brownie made with premium cocoa " * 4,
+            "price": round(149.99 + index * 10, 2),
+            "image_url": "",
+            "category": categories[index % len(categories)],
+            "available": index % 7 != 0,
+        }
+        for index in range(1, count + 1)
+    ]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run an in-memory PostgREST stand-in")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakePostgREST(args.latency_ms, args.jitter_ms, port=args.port)
+    server.seed("products", sample_products())
+    register_shop_functions(server)
+    print(f"Fake PostgREST listening on {server.url} (SUPABASE_URL={server.url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
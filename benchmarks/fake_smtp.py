@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in for trying email delivery without a mail account.
+
+Accepts plain (no TLS, no AUTH) SMTP sessions, keeps every message in memory
+and prints its subject, size and attachments. Like a real provider it
+advertises a message size limit and rejects larger messages with 552, and
+--reject makes it refuse every message with a given code to exercise the
+failure paths.
+
+    python benchmarks/fake_smtp.py --port 2525 --max-bytes 26214400
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=false SMTP_PASSWORD= python app.py
+"""
+
+import argparse
+import email
+import re
+import socketserver
+import threading
+
+SIZE_PARAM = re.compile(rb"SIZE=(\d+)", re.IGNORECASE)
+
+class FakeSMTP:
+    """Threaded SMTP server collecting messages in memory"""
+
+    def __init__(self, max_bytes: int = 25 * 1024 * 1024, reject_code: int = 0, host: str = "127.0.0.1", port: int = 0, verbose: bool = False):
+        self.max_bytes = max_bytes
+        self.reject_code = reject_code
+        self.verbose = verbose
+        self.messages = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def deliver(self, sender: str, recipients: list, data: bytes):
+        message = email.message_from_bytes(data)
+        attachments = [part.get_filename() for part in message.walk() if part.get_filename()]
+        with self.lock:
+            self.messages.append({"from": sender, "to": recipients, "size": len(data), "message": message, "attachments": attachments})
+        if self.verbose:
+            print(f"{message['Subject']!r} to {', '.join(recipients)}: {len(data)} bytes, attachments {attachments}", flush=True)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                self.reply("220 fake-smtp ready")
+                sender, recipients = None, []
+                for line in self.rfile:
+                    command = line.rstrip(b"\r\n")
+                    verb = command[:4].upper()
+                    if verb == b"EHLO":
+                        self.reply("250-fake-smtp")
+                        self.reply(f"250 SIZE {fake.max_bytes}")
+                    elif verb == b"HELO" or verb == b"NOOP":
+                        self.reply("250 OK")
+                    elif verb == b"RSET":
+                        sender, recipients = None, []
+                        self.reply("250 OK")
+                    elif verb == b"MAIL":
+                        size = SIZE_PARAM.search(command)
+                        if size and int(size.group(1)) > fake.max_bytes:
+                            fake.rejected += 1
+                            self.reply("552 Message size exceeds fixed maximum message size")
+                            continue
+                        sender, recipients = command.split(b":", 1)[1].split()[0].strip(b"<>").decode(), []
+                        self.reply("250 OK")
+                    elif verb == b"RCPT":
+                        recipients.append(command.split(b":", 1)[1].strip().strip(b"<>").decode())
+                        self.reply("250 OK")
+                    elif verb == b"DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = self.read_data()
+                        if fake.reject_code:
+                            fake.rejected += 1
+                            self.reply(f"{fake.reject_code} Message rejected")
+                        elif len(data) > fake.max_bytes:
+                            fake.rejected += 1
+                            self.reply("552 Message size exceeds fixed maximum message size")
+                        else:
+                            fake.deliver(sender, recipients, data)
+                            self.reply("250 OK")
+                        sender, recipients = None, []
+                    elif verb == b"QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+            def read_data(self):
+                lines = []
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    lines.append(line[1:] if line.startswith(b".") else line)
+                return b"".join(lines)
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--max-bytes", type=int, default=25 * 1024 * 1024, help="largest accepted message, like a provider's limit")
+    parser.add_argument("--reject", type=int, default=0, help="refuse every message with this SMTP code, e.g. 550 or 451")
+    args = parser.parse_args()
+
+    server = FakeSMTP(args.max_bytes, args.reject, args.host, args.port, verbose=True)
+    host, port = server.start()
+    print(f"Fake SMTP server listening on {host}:{port} (Ctrl+C to stop)")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
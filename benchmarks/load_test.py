@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Load test for the shop's main user journeys.
+
+Virtual users repeatedly pick a scenario from a traffic mix and run it
+against app.py, which is backed by the in-memory PostgREST stand-in with
+injected latency:
+
+    browse    settings, product list, search and product detail
+    cart      add to cart, batched quantity change, cart view
+    checkout  fill the cart, read the total and create an order
+    receipt   upload a payment receipt for the user's last order
+    review    admin lists pending receipts and approves them
+
+Throughput and p50/p95/p99 latency are reported per route and saved as JSON
+(tagged with the current commit) so runs can be compared across commits:
+
+    python benchmarks/load_test.py --mix mixed --users 20 --duration 20
+    python benchmarks/load_test.py --compare benchmarks/results/load_test-<commit>.json
+
+--url runs the same traffic against an already running server instead, e.g.
+one started with SUPABASE_URL pointing at `python benchmarks/fake_postgrest.py`.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from common import REPO_ROOT, load_app, percentile
+from fake_postgrest import FakePostgREST, register_shop_functions, sample_products
+
+MIXES = {
+    "shopper": {"browse": 60, "cart": 25, "checkout": 10, "receipt": 5},
+    "admin": {"review": 100},
+    "mixed": {"browse": 50, "cart": 20, "checkout": 12, "receipt": 10, "review": 8},
+}
+SEARCH_TERMS = ["brownie", "fudgy", "cocoa", "cookie", "cake", "blondie", "rich"]
+# A few distinct receipt files; uploads are content-addressed so these are stored once
+RECEIPTS = [b"\x89PNG\r\n\x1a\n" + bytes([index]) * 4096 for index in range(4)]
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+class Recorder:
+    """Latency samples and error counts per route"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.samples[route].append((time.perf_counter() - started) * 1000)
+            self.errors[route] += 1
+            return None
+        self.samples[route].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+            return None
+        return response
+
+class VirtualUser:
+    def __init__(self, client, recorder: Recorder, headers: dict, admin_headers: dict, product_ids: list, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.headers = headers
+        self.admin_headers = admin_headers
+        self.product_ids = product_ids
+        self.rng = rng
+        self.last_order_id = None
+
+    async def call(self, route: str, method: str, url: str, admin: bool = False, **kwargs):
+        headers = self.admin_headers if admin else self.headers
+        return await self.recorder.call(self.client, route, method, url, headers=headers, **kwargs)
+
+    async def browse(self):
+        await self.call("GET /api/settings", "GET", "/api/settings")
+        await self.call("GET /api/products", "GET", "/api/products")
+        await self.call("GET /api/products?q", "GET", "/api/products", params={"q": self.rng.choice(SEARCH_TERMS), "sort": "price_asc"})
+        await self.call("GET /api/products/{id}", "GET", f"/api/products/{self.rng.choice(self.product_ids)}")
+
+    async def cart(self):
+        product_id = self.rng.choice(self.product_ids)
+        await self.call("POST /api/cart/add", "POST", "/api/cart/add", json={"product_id": product_id, "quantity": 1})
+        await self.call("POST /api/cart/items", "POST", "/api/cart/items", json={"items": [
+            {"product_id": product_id, "quantity": self.rng.choice([1, -1])},
+            {"product_id": self.rng.choice(self.product_ids), "quantity": 1}
+        ]})
+        await self.call("GET /api/cart", "GET", "/api/cart")
+
+    async def checkout(self):
+        items = [{"product_id": product_id, "quantity": self.rng.randint(1, 3)}
+                 for product_id in self.rng.sample(self.product_ids, self.rng.randint(1, 3))]
+        await self.call("POST /api/cart/items", "POST", "/api/cart/items", json={"items": items})
+        response = await self.call("GET /api/cart", "GET", "/api/cart")
+        if response is None:
+            return
+        cart = response.json()
+        if not cart["items"]:
+            return
+        order = {
+            "items": [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in cart["items"]],
+            "total_amount": cart["total"]
+        }
+        response = await self.call("POST /api/create-order", "POST", "/api/create-order", json=order)
+        if response is not None:
+            self.last_order_id = response.json()["order_id"]
+
+    async def receipt(self):
+        if self.last_order_id is None:
+            await self.checkout()
+        if self.last_order_id is None:
+            return
+        await self.call(
+            "POST /api/upload-payment-receipt/{order_id}", "POST", f"/api/upload-payment-receipt/{self.last_order_id}",
+            files={"file": ("receipt.png", self.rng.choice(RECEIPTS), "image/png")},
+            data={"notes": "Paid via UPI"}
+        )
+        self.last_order_id = None
+
+    async def review(self):
+        response = await self.call("GET /api/admin/payment-uploads", "GET", "/api/admin/payment-uploads",
+                                   admin=True, params={"status": "pending", "limit": 20})
+        if response is None:
+            return
+        pending = [upload["id"] for upload in response.json()["items"]]
+        if not pending:
+            return
+        await self.call("PUT /api/admin/payment-uploads/{id}/status", "PUT", f"/api/admin/payment-uploads/{pending[0]}/status",
+                        admin=True, data={"status": "approved", "admin_notes": "Verified"})
+        if len(pending) > 1:
+            await self.call("POST /api/admin/payment-uploads/approve", "POST", "/api/admin/payment-uploads/approve",
+                            admin=True, json={"upload_ids": pending[1:10]})
+
+async def sign_in(client, users: int, admin_email: str, admin_password: str, run_id: str):
+    """Register and log in the shoppers and the admin, returning their auth headers"""
+    response = await client.post("/api/login", json={"email": admin_email, "password": admin_password})
+    response.raise_for_status()
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def shopper(index: int):
+        credentials = {"email": f"loadtest-{run_id}-{index}@example.com", "password": "loadtest-password"}
+        response = await client.post("/api/register", json={**credentials, "name": f"Load Test {index}"})
+        response.raise_for_status()
+        response = await client.post("/api/login", json=credentials)
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return await asyncio.gather(*(shopper(index) for index in range(users))), admin_headers
+
+async def run(client, args) -> dict:
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    run_id = hashlib.sha256(f"{time.time()}-{args.seed}".encode()).hexdigest()[:8]
+    shopper_headers, admin_headers = await sign_in(client, args.users, args.admin_email, args.admin_password, run_id)
+    products = (await client.get("/api/products")).json()
+    product_ids = [product["id"] for product in products]
+
+    mix = MIXES[args.mix]
+    scenarios, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + args.duration
+    counts = defaultdict(int)
+
+    async def user_loop(headers: dict, seed: int):
+        user = VirtualUser(client, recorder, headers, admin_headers, product_ids, random.Random(seed))
+        while time.perf_counter() < deadline:
+            scenario = user.rng.choices(scenarios, weights)[0]
+            counts[scenario] += 1
+            await getattr(user, scenario)()
+            if args.think_ms:
+                await asyncio.sleep(user.rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(headers, rng.random()) for headers in shopper_headers))
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        routes[route] = {
+            "requests": len(samples),
+            "errors": recorder.errors[route],
+            "rps": round(len(samples) / elapsed, 1),
+            "mean_ms": round(sum(samples) / len(samples), 2),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+        }
+    all_samples = [sample for samples in recorder.samples.values() for sample in samples]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": len(all_samples),
+        "errors": sum(recorder.errors.values()),
+        "rps": round(len(all_samples) / elapsed, 1),
+        "p50_ms": round(percentile(all_samples, 50), 2),
+        "p95_ms": round(percentile(all_samples, 95), 2),
+        "p99_ms": round(percentile(all_samples, 99), 2),
+        "scenarios": dict(counts),
+        "routes": routes,
+    }
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(result: dict):
+    print(f"{'route':<48} {'reqs':>6} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, stats in result["routes"].items():
+        print(f"{route:<48} {stats['requests']:>6} {stats['errors']:>4} {stats['rps']:>7} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+    print(f"{'total':<48} {result['requests']:>6} {result['errors']:>4} {result['rps']:>7} "
+          f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+
+def print_comparison(result: dict, baseline: dict, threshold: float):
+    """Show per-route throughput and p95 changes, flagging regressions beyond threshold percent"""
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):")
+    rows = [("total", result, baseline)] + [
+        (route, stats, baseline["routes"][route]) for route, stats in result["routes"].items() if route in baseline["routes"]
+    ]
+    for route, current, previous in rows:
+        rps_change = (current["rps"] - previous["rps"]) / previous["rps"] * 100 if previous["rps"] else 0.0
+        p95_change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        flag = "  REGRESSION" if rps_change < -threshold or p95_change > threshold else ""
+        print(f"{route:<48} rps {rps_change:+7.1f}%   p95 {p95_change:+7.1f}%{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between scenarios")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="injected backend latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--products", type=int, default=48)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="target a running server instead of loading app.py in-process")
+    parser.add_argument("--admin-email", default=os.getenv("ADMIN_EMAIL", "admin@brownieshop.com"))
+    parser.add_argument("--admin-password", default=os.getenv("ADMIN_PASSWORD", "admin123"))
+    parser.add_argument("--output", help="results file (default benchmarks/results/load_test-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change flagged as a regression")
+    args = parser.parse_args()
+
+    backend = None
+    job_dir = tempfile.TemporaryDirectory()
+    receipt_keys = [f"payment_{hashlib.sha256(receipt).hexdigest()}.png" for receipt in RECEIPTS]
+    preexisting = set()
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        backend = FakePostgREST(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+        backend.seed("products", sample_products(args.products))
+        register_shop_functions(backend)
+        app_module = load_app(
+            backend.start(),
+            # Cheap hashes keep sign-up of the virtual users out of the measurement
+            BCRYPT_ROUNDS=4,
+            JOB_DB_PATH=Path(job_dir.name) / "jobs.sqlite3",
+            NOTIFY_DIGEST_SECONDS=3600,
+            SMTP_USERNAME="",
+            SLOW_REQUEST_SECONDS=3600,
+        )
+        preexisting = {key for key in receipt_keys if (app_module.UPLOAD_DIR / key).exists()}
+        client = httpx.AsyncClient(app=app_module.app, base_url="http://benchmark", timeout=60)
+
+    async def session():
+        async with client:
+            return await run(client, args)
+
+    try:
+        result = asyncio.run(session())
+    finally:
+        if backend is not None:
+            app_module.job_queue.stop()
+            backend.stop()
+            for key in receipt_keys:
+                if key not in preexisting:
+                    (app_module.UPLOAD_DIR / key).unlink(missing_ok=True)
+        job_dir.cleanup()
+
+    commit = current_commit()
+    result = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("admin_password", "output", "compare")},
+        "backend_requests": backend.request_count if backend else None,
+        "supabase_pool": app_module.supabase_pool.stats() if backend else None,
+        **result,
+    }
+    print_report(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load_test-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        print_comparison(result, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.threshold)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Login storm benchmark.
+
+Sends a burst of concurrent POST /api/login requests for regular users (each
+one a bcrypt verification) and reports logins per second, latency and event
+loop lag for each password pool size. Every pool size runs in its own
+process because PASSWORD_WORKERS is read at import time.
+
+    python benchmarks/login_storm.py --workers 1 2 4 --logins 64 --rounds 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from common import load_app, percentile
+from fake_postgrest import FakePostgREST
+from event_loop_lag import heartbeat
+
+PASSWORD = "brownies-for-everyone"
+
+async def storm(app_module, logins: int, users: int):
+    lag_samples, latencies = [], []
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(app=app_module.app, base_url="http://benchmark", timeout=120) as client:
+        async def one_login(index: int):
+            started = time.perf_counter()
+            response = await client.post("/api/login", json={"email": f"user{index % users}@example.com", "password": PASSWORD})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        ticker = asyncio.create_task(heartbeat(lag_samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login(index) for index in range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+    return {
+        "logins": logins,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(logins / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50), 2),
+        "latency_p99_ms": round(percentile(latencies, 99), 2),
+        "loop_lag_max_ms": round(max(lag_samples, default=0.0), 2),
+    }
+
+def run_single(args):
+    backend = FakePostgREST()
+    app_module = load_app(backend.start(), PASSWORD_WORKERS=args.single, BCRYPT_ROUNDS=args.rounds,
+                          PASSWORD_MAX_PENDING=args.logins)
+    hashed = app_module.hash_password(PASSWORD)
+    backend.seed("users", [{"email": f"user{index}@example.com", "password": hashed, "name": "Shopper"}
+                           for index in range(args.users)])
+    try:
+        result = asyncio.run(storm(app_module, args.logins, args.users))
+    finally:
+        backend.stop()
+    result["workers"] = args.single
+    result["bcrypt_rounds"] = args.rounds
+    result["pool"] = app_module.password_pool_stats.snapshot()
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    results = []
+    for workers in dict.fromkeys(args.workers):
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", str(workers), "--logins", str(args.logins),
+             "--users", str(args.users), "--rounds", str(args.rounds)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Checkout latency benchmark.
+
+Creates orders of increasing size through POST /api/create-order against a
+fake PostgREST with injected latency and reports latency and backend round
+trips per order. By default the create_order_with_items function is
+available (one round trip to read current prices, one to write the order);
+--no-rpc measures the bulk insert fallback. The per-item insert loop it
+replaced needed items + 2 round trips.
+
+    python benchmarks/order_latency.py --latency-ms 30 --sizes 1 5 10 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from common import load_app, percentile
+from fake_postgrest import FakePostgREST, register_shop_functions, sample_products
+
+async def run(app_module, backend, sizes: list, repeats: int):
+    results = []
+    async with httpx.AsyncClient(app=app_module.app, base_url="http://benchmark") as client:
+        token = app_module.create_access_token({"sub": "shopper@example.com", "role": "user"})
+        headers = {"Authorization": f"Bearer {token}"}
+        # Warm the catalog cache so only checkout round trips are counted
+        (await client.get("/api/products")).raise_for_status()
+        available = [product["id"] for product in backend.tables["products"] if product["available"]]
+        for size in sizes:
+            # Prices and the total are computed server-side from current database prices
+            payload = {"items": [{"product_id": product_id, "quantity": 1} for product_id in available[:size]]}
+            latencies, round_trips = [], []
+            for _ in range(repeats):
+                before = backend.request_count
+                started = time.perf_counter()
+                response = await client.post("/api/create-order", json=payload, headers=headers)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+                round_trips.append(backend.request_count - before)
+            results.append({
+                "items": size,
+                "round_trips": max(round_trips),
+                "legacy_round_trips": size + 2,
+                "latency_p50_ms": round(percentile(latencies, 50), 2),
+                "latency_p95_ms": round(percentile(latencies, 95), 2),
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--no-rpc", action="store_true", help="measure the bulk insert fallback")
+    args = parser.parse_args()
+
+    backend = FakePostgREST(latency_ms=args.latency_ms)
+    backend.seed("products", sample_products(max(args.sizes) * 2))
+    if not args.no_rpc:
+        register_shop_functions(backend)
+    app_module = load_app(backend.start())
+
+    try:
+        results = asyncio.run(run(app_module, backend, args.sizes, args.repeats))
+    finally:
+        backend.stop()
+    print(json.dumps({
+        "mode": "bulk" if args.no_rpc else "rpc",
+        "backend_latency_ms": args.latency_ms,
+        "results": results
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
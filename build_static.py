@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Brownie Shop Static Asset Build
+
+Fingerprints the frontend assets with content hashes, precompresses them with
+gzip (and brotli when the `brotli` package is installed) and writes the
+results to frontend/dist together with an index.html that references the
+hashed filenames. app.py serves these with immutable caching.
+"""
+
+import gzip
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+FRONTEND_DIR = Path("frontend")
+DIST_DIR = FRONTEND_DIR / "dist"
+HASHED_EXTENSIONS = {".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".woff", ".woff2"}
+COMPRESSED_EXTENSIONS = {".css", ".js", ".html", ".svg", ".json", ".txt"}
+
+def content_hash(data: bytes):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def write_compressed(path: Path, data: bytes):
+    """Write .gz and .br siblings next to a text asset"""
+    if path.suffix not in COMPRESSED_EXTENSIONS:
+        return
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if BROTLI_AVAILABLE:
+        path.with_name(path.name + ".br").write_bytes(brotli.compress(data, quality=11))
+
+def build_assets():
+    """Copy every frontend asset to dist under a content-hashed name"""
+    manifest = {}
+    for source in sorted(FRONTEND_DIR.rglob("*")):
+        if not source.is_file() or DIST_DIR in source.parents or source.suffix not in HASHED_EXTENSIONS:
+            continue
+        data = source.read_bytes()
+        relative = source.relative_to(FRONTEND_DIR)
+        hashed_name = f"{source.stem}.{content_hash(data)}{source.suffix}"
+        target = DIST_DIR / relative.parent / hashed_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        write_compressed(target, data)
+        manifest[relative.as_posix()] = (relative.parent / hashed_name).as_posix()
+        print(f"✓ {relative.as_posix()} -> dist/{manifest[relative.as_posix()]}")
+    return manifest
+
+def build_index(manifest: dict):
+    """Rewrite index.html to reference the hashed asset names"""
+    html = (FRONTEND_DIR / "index.html").read_text(encoding="utf-8")
+    for original, hashed in manifest.items():
+        html = html.replace(f"/static/{original}", f"/static/dist/{hashed}")
+    target = DIST_DIR / "index.html"
+    data = html.encode("utf-8")
+    target.write_bytes(data)
+    write_compressed(target, data)
+    print("✓ index.html -> dist/index.html")
+
+def main():
+    print("Brownie Shop - Static Asset Build")
+    print("=" * 40)
+
+    if not (FRONTEND_DIR / "index.html").exists():
+        print("✗ Run this script from the project root")
+        sys.exit(1)
+
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    manifest = build_assets()
+    build_index(manifest)
+    (DIST_DIR / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    if not BROTLI_AVAILABLE:
+        print("Note: brotli not installed - only gzip variants were written (pip install brotli)")
+    print(f"✓ Wrote {len(manifest)} assets to {DIST_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -14,12 +14,16 @@ CREATE TABLE IF NOT EXISTS products (
     description TEXT,
     price DECIMAL(10, 2) NOT NULL,
     image_url TEXT,
+    image_variants JSONB,
     category VARCHAR(100) DEFAULT 'brownie',
     available BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Responsive image derivatives for databases created before the column existed
+ALTER TABLE products ADD COLUMN IF NOT EXISTS image_variants JSONB;
+
 -- Create cart table
 CREATE TABLE IF NOT EXISTS cart (
     id SERIAL PRIMARY KEY,
@@ -67,6 +71,80 @@ CREATE TABLE IF NOT EXISTS payment_uploads (
     admin_notes TEXT
 );
 
+-- Create uploads table indexing every stored upload by its content-addressed key
+CREATE TABLE IF NOT EXISTS uploads (
+    key TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(100),
+    storage VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create an order, its items and clear the cart in a single transaction
+CREATE OR REPLACE FUNCTION create_order_with_items(p_user_email VARCHAR, p_total_amount DECIMAL, p_items JSONB)
+RETURNS SETOF orders
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_order orders%ROWTYPE;
+BEGIN
+    INSERT INTO orders (user_email, total_amount, status, created_at)
+    VALUES (p_user_email, p_total_amount, 'pending', NOW())
+    RETURNING * INTO new_order;
+
+    INSERT INTO order_items (order_id, product_id, quantity, price)
+    SELECT new_order.id, (item->>'product_id')::INTEGER, (item->>'quantity')::INTEGER, (item->>'price')::DECIMAL(10, 2)
+    FROM jsonb_array_elements(p_items) AS item;
+
+    DELETE FROM cart WHERE user_email = p_user_email;
+
+    RETURN NEXT new_order;
+END;
+$$;
+
+-- Add quantity deltas to a cart in one statement, removing lines that drop to zero
+CREATE OR REPLACE FUNCTION apply_cart_deltas(p_user_email VARCHAR, p_items JSONB)
+RETURNS SETOF cart
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH upserted AS (
+        INSERT INTO cart (user_email, product_id, quantity)
+        SELECT p_user_email, (item->>'product_id')::INTEGER, (item->>'quantity')::INTEGER
+        FROM jsonb_array_elements(p_items) AS item
+        ON CONFLICT (user_email, product_id)
+        DO UPDATE SET quantity = cart.quantity + EXCLUDED.quantity
+        RETURNING *
+    )
+    SELECT * FROM upserted WHERE quantity > 0;
+
+    DELETE FROM cart WHERE user_email = p_user_email AND quantity <= 0;
+END;
+$$;
+
+-- Set the review status of payment uploads and confirm their orders on approval, in one statement
+CREATE OR REPLACE FUNCTION set_payment_status(p_upload_ids INTEGER[], p_status VARCHAR, p_admin_notes TEXT DEFAULT NULL)
+RETURNS TABLE (id INTEGER, order_id INTEGER, status VARCHAR, admin_notes TEXT, order_status VARCHAR)
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE payment_uploads
+        SET status = p_status, admin_notes = COALESCE(p_admin_notes, payment_uploads.admin_notes)
+        WHERE payment_uploads.id = ANY(p_upload_ids)
+        RETURNING payment_uploads.id, payment_uploads.order_id, payment_uploads.status, payment_uploads.admin_notes
+    ), confirmed AS (
+        UPDATE orders
+        SET status = 'confirmed'
+        WHERE p_status = 'approved' AND orders.id IN (SELECT updated.order_id FROM updated)
+        RETURNING orders.id, orders.status
+    )
+    SELECT updated.id, updated.order_id, updated.status, updated.admin_notes, COALESCE(confirmed.status, orders.status)
+    FROM updated
+    LEFT JOIN confirmed ON confirmed.id = updated.order_id
+    LEFT JOIN orders ON orders.id = updated.order_id;
+$$;
+
 -- Insert sample products
 INSERT INTO products (name, description, price, category, image_url) VALUES
 ('Classic Chocolate Brownie', 'Rich and fudgy chocolate brownie made with premium cocoa', 199.99, 'brownie', ''),
@@ -88,5 +166,22 @@ CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
 CREATE INDEX IF NOT EXISTS idx_products_available ON products(available);
 CREATE INDEX IF NOT EXISTS idx_cart_user_email ON cart(user_email);
+-- One row per product per cart. Carts written before this index may hold several rows for the same
+-- product, so fold them into the oldest row (summing quantities) and delete the rest first
+UPDATE cart SET quantity = merged.quantity
+FROM (
+    SELECT MIN(id) AS id, SUM(quantity) AS quantity
+    FROM cart
+    GROUP BY user_email, product_id
+    HAVING COUNT(*) > 1
+) AS merged
+WHERE cart.id = merged.id;
+DELETE FROM cart USING cart AS kept
+WHERE cart.user_email = kept.user_email AND cart.product_id = kept.product_id AND cart.id > kept.id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_product ON cart(user_email, product_id);
 CREATE INDEX IF NOT EXISTS idx_orders_user_email ON orders(user_email);
-CREATE INDEX IF NOT EXISTS idx_settings_key ON settings(key);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_settings_key ON settings(key);
+-- Keyset pagination of the admin payment uploads list, with and without a status filter
+CREATE INDEX IF NOT EXISTS idx_payment_uploads_time_id ON payment_uploads(upload_time DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_payment_uploads_status_time_id ON payment_uploads(status, upload_time DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_payment_uploads_order_id ON payment_uploads(order_id);
\ No newline at end of file
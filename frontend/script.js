@@ -1,6 +1,7 @@
 // Global variables
 let currentUser = null;
 let cart = [];
+let cartTotal = 0;
 let products = [];
 let isAdmin = false;
 let currentOrderId = null;
@@ -13,8 +14,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
     setupEventListeners();
     loadProducts();
-    loadContactInfo();
-    loadCompanyInfo();
+    loadSettings();
     checkAuthStatus();
 });
 
@@ -40,6 +40,15 @@ function setupEventListeners() {
     // Navigation
     document.querySelector('.hamburger').addEventListener('click', toggleMobileMenu);
     
+    // Product search and filters
+    let searchTimer = null;
+    document.getElementById('product-search').addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(searchProducts, 250);
+    });
+    document.getElementById('product-category-filter').addEventListener('change', searchProducts);
+    document.getElementById('product-sort').addEventListener('change', searchProducts);
+    
     // Modal controls
     setupModalControls();
     
@@ -67,6 +76,8 @@ function setupEventListeners() {
     document.getElementById('company-settings-form').addEventListener('submit', handleCompanyUpdate);
     document.getElementById('contact-settings-form').addEventListener('submit', handleContactUpdate);
     document.getElementById('payment-settings-form').addEventListener('submit', handlePaymentUpdate);
+    document.getElementById('payment-status-filter').addEventListener('change', () => loadPaymentUploads());
+    document.getElementById('payment-uploads-more').addEventListener('click', () => loadPaymentUploads(true));
     
     // Payment upload
     document.getElementById('payment-upload-form').addEventListener('submit', handlePaymentUpload);
@@ -139,7 +150,9 @@ async function apiCall(endpoint, options = {}) {
         const data = await response.json();
         
         if (!response.ok) {
-            throw new Error(data.detail || 'API call failed');
+            const error = new Error(data.detail || 'API call failed');
+            error.status = response.status;
+            throw error;
         }
         
         return data;
@@ -241,12 +254,43 @@ function checkAuthStatus() {
 async function loadProducts() {
     try {
         products = await apiCall('/products');
-        displayProducts(products);
+        populateCategoryFilter(products);
+        searchProducts();
     } catch (error) {
         console.error('Failed to load products:', error);
     }
 }
 
+function populateCategoryFilter(allProducts) {
+    const select = document.getElementById('product-category-filter');
+    const selected = select.value;
+    const categories = [...new Set(allProducts.map(product => product.category).filter(Boolean))].sort();
+    select.innerHTML = '<option value="">All categories</option>' +
+        categories.map(category => `<option value="${category}">${category.charAt(0).toUpperCase() + category.slice(1)}</option>`).join('');
+    select.value = categories.includes(selected) ? selected : '';
+}
+
+// Search, category and sort are evaluated by the server's catalog index
+async function searchProducts() {
+    const params = new URLSearchParams();
+    const query = document.getElementById('product-search').value.trim();
+    const category = document.getElementById('product-category-filter').value;
+    const sort = document.getElementById('product-sort').value;
+    if (query) params.set('q', query);
+    if (category) params.set('category', category);
+    if (sort) params.set('sort', sort);
+    
+    if (!params.toString()) {
+        displayProducts(products);
+        return;
+    }
+    try {
+        displayProducts(await apiCall(`/products?${params}`));
+    } catch (error) {
+        console.error('Failed to search products:', error);
+    }
+}
+
 function displayProducts(productsToShow) {
     const grid = document.getElementById('products-grid');
     grid.innerHTML = '';
@@ -264,7 +308,7 @@ function createProductCard(product) {
     const imageUrl = product.image_url || 'https://images.unsplash.com/photo-1606313564200-e75d5e30476c?ixlib=rb-4.0.3&auto=format&fit=crop&w=400&q=80';
     
     card.innerHTML = `
-        <img src="${imageUrl}" alt="${product.name}" class="product-image">
+        ${productImageHtml(product, imageUrl)}
         <div class="product-info">
             <h3 class="product-name">${product.name}</h3>
             <p class="product-description">${product.description}</p>
@@ -278,32 +322,92 @@ function createProductCard(product) {
     return card;
 }
 
-// Cart functionality
-async function addToCart(productId) {
-    if (!currentUser) {
-        showNotification('Please login to add items to cart', 'error');
-        showLoginModal();
-        return;
+// Responsive product image: the browser picks the smallest derivative that
+// fits the card, preferring WebP
+function productImageHtml(product, imageUrl) {
+    const variants = product.image_variants;
+    if (!variants || !variants.jpeg) {
+        return `<img src="${imageUrl}" alt="${product.name}" class="product-image" loading="lazy">`;
     }
     
+    const srcset = list => list.map(variant => `${variant.url} ${variant.width}w`).join(', ');
+    const sizes = '(max-width: 768px) 100vw, 400px';
+    return `
+        <picture>
+            <source type="image/webp" srcset="${srcset(variants.webp)}" sizes="${sizes}">
+            <img src="${imageUrl}" srcset="${srcset(variants.jpeg)}" sizes="${sizes}" alt="${product.name}" class="product-image" loading="lazy">
+        </picture>`;
+}
+
+// Cart functionality
+// Quantity changes are queued and sent together, so rapid "Add to Cart"
+// taps cost a single request. Changes that could not be sent stay queued
+// and go out with the next flush.
+let pendingCartDeltas = {};
+let cartFlushTimer = null;
+
+function queueCartDelta(productId, delta) {
+    pendingCartDeltas[productId] = (pendingCartDeltas[productId] || 0) + delta;
+    clearTimeout(cartFlushTimer);
+    cartFlushTimer = setTimeout(flushCartDeltas, 300);
+}
+
+// Never throws: it also runs from a timer. Returns whether the changes were saved
+async function flushCartDeltas() {
+    clearTimeout(cartFlushTimer);
+    const items = Object.entries(pendingCartDeltas)
+        .filter(([, quantity]) => quantity !== 0)
+        .map(([productId, quantity]) => ({ product_id: parseInt(productId), quantity }));
+    pendingCartDeltas = {};
+    
+    if (items.length === 0) return true;
+    
     try {
-        await apiCall('/cart/add', {
+        await apiCall('/cart/items', {
             method: 'POST',
-            body: JSON.stringify({ product_id: productId, quantity: 1 })
+            body: JSON.stringify({ items })
         });
-        
-        loadCart();
-        showNotification('Item added to cart!', 'success');
+        return true;
     } catch (error) {
-        showNotification('Failed to add item to cart', 'error');
+        if (!error.status || error.status >= 500) {
+            // Network or server trouble: merge the changes back in (with any
+            // taps made meanwhile) so the next flush sends them again
+            items.forEach(({ product_id, quantity }) => {
+                pendingCartDeltas[product_id] = (pendingCartDeltas[product_id] || 0) + quantity;
+            });
+            showNotification('Your cart could not be updated, it will be retried with your next change', 'error');
+        }
+        // A rejected request (e.g. an unavailable product) would fail the same
+        // way again, so those changes are dropped; apiCall has shown the reason
+        return false;
+    } finally {
+        await loadCart();
     }
 }
 
+function addToCart(productId) {
+    if (!currentUser) {
+        showNotification('Please login to add items to cart', 'error');
+        showLoginModal();
+        return;
+    }
+    
+    queueCartDelta(productId, 1);
+    
+    // Update the badge right away; the server copy arrives with the next flush
+    const badge = document.getElementById('cart-count');
+    badge.textContent = parseInt(badge.textContent || '0') + 1;
+    showNotification('Item added to cart!', 'success');
+}
+
 async function loadCart() {
     if (!currentUser) return;
     
     try {
-        cart = await apiCall('/cart');
+        // The browser revalidates with the cart's ETag and reuses its copy on 304
+        const data = await apiCall('/cart');
+        cart = data.items;
+        cartTotal = data.total;
         updateCartCount();
     } catch (error) {
         console.error('Failed to load cart:', error);
@@ -311,7 +415,9 @@ async function loadCart() {
 }
 
 function updateCartCount() {
-    const count = cart.reduce((total, item) => total + item.quantity, 0);
+    // Include queued changes so the badge does not jump back before they are sent
+    const pending = Object.values(pendingCartDeltas).reduce((total, delta) => total + delta, 0);
+    const count = Math.max(0, cart.reduce((total, item) => total + item.quantity, pending));
     document.getElementById('cart-count').textContent = count;
 }
 
@@ -322,6 +428,7 @@ async function showCart() {
         return;
     }
     
+    await flushCartDeltas();
     await loadCart();
     displayCartItems();
     document.getElementById('cart-modal').style.display = 'block';
@@ -337,15 +444,10 @@ function displayCartItems() {
         return;
     }
     
-    let total = 0;
-    
     cart.forEach(item => {
         const cartItem = document.createElement('div');
         cartItem.className = 'cart-item';
         
-        const itemTotal = item.products.price * item.quantity;
-        total += itemTotal;
-        
         cartItem.innerHTML = `
             <div class="cart-item-info">
                 <div class="cart-item-name">${item.products.name}</div>
@@ -364,7 +466,7 @@ function displayCartItems() {
         cartItemsContainer.appendChild(cartItem);
     });
     
-    document.getElementById('cart-total').textContent = total.toFixed(2);
+    document.getElementById('cart-total').textContent = cartTotal.toFixed(2);
 }
 
 async function updateCartQuantity(itemId, newQuantity) {
@@ -373,10 +475,13 @@ async function updateCartQuantity(itemId, newQuantity) {
         return;
     }
     
-    // This would require an update cart endpoint
-    // For now, we'll remove and re-add
-    await removeFromCart(itemId);
-    // Add logic to re-add with new quantity
+    const item = cart.find(line => line.id === itemId);
+    if (!item) return;
+    
+    queueCartDelta(item.product_id, newQuantity - item.quantity);
+    // Failures are reported by flushCartDeltas; show the cart as the server has it
+    await flushCartDeltas();
+    displayCartItems();
 }
 
 async function removeFromCart(itemId) {
@@ -405,7 +510,8 @@ async function showCheckout() {
             price: item.products.price
         }));
         
-        const totalAmount = cart.reduce((total, item) => total + (item.products.price * item.quantity), 0);
+        // Exact server-computed total, so it matches the order pricing
+        const totalAmount = cartTotal;
         
         const orderResponse = await apiCall('/create-order', {
             method: 'POST',
@@ -474,6 +580,18 @@ async function handlePaymentUpload(e) {
     }
 }
 
+// Settings
+async function loadSettings() {
+    try {
+        // One request for contact, payment and company info
+        const settings = await apiCall('/settings');
+        displayContactInfo(settings.contact_info);
+        displayCompanyInfo(settings.company_info);
+    } catch (error) {
+        console.error('Failed to load settings:', error);
+    }
+}
+
 // Contact
 async function loadContactInfo() {
     try {
@@ -487,31 +605,35 @@ async function loadContactInfo() {
 async function loadCompanyInfo() {
     try {
         const companyInfo = await apiCall('/company-info');
-        // Update page title and branding
-        document.title = `${companyInfo.name} - ${companyInfo.tagline}`;
-        
-        // Update navigation logo
-        const navLogo = document.querySelector('.nav-logo span');
-        if (navLogo) {
-            navLogo.textContent = companyInfo.name;
-        }
-        
-        // Update hero section
-        const heroTitle = document.querySelector('.hero-content h1');
-        if (heroTitle) {
-            heroTitle.textContent = companyInfo.tagline;
-        }
-        
-        // Update footer
-        const footerLogo = document.querySelector('.footer-section h3');
-        if (footerLogo) {
-            footerLogo.innerHTML = `<i class="fas fa-cookie-bite"></i> ${companyInfo.name}`;
-        }
+        displayCompanyInfo(companyInfo);
     } catch (error) {
         console.error('Failed to load company info:', error);
     }
 }
 
+function displayCompanyInfo(companyInfo) {
+    // Update page title and branding
+    document.title = `${companyInfo.name} - ${companyInfo.tagline}`;
+    
+    // Update navigation logo
+    const navLogo = document.querySelector('.nav-logo span');
+    if (navLogo) {
+        navLogo.textContent = companyInfo.name;
+    }
+    
+    // Update hero section
+    const heroTitle = document.querySelector('.hero-content h1');
+    if (heroTitle) {
+        heroTitle.textContent = companyInfo.tagline;
+    }
+    
+    // Update footer
+    const footerLogo = document.querySelector('.footer-section h3');
+    if (footerLogo) {
+        footerLogo.innerHTML = `<i class="fas fa-cookie-bite"></i> ${companyInfo.name}`;
+    }
+}
+
 function displayContactInfo(contactInfo) {
     const container = document.getElementById('contact-info');
     container.innerHTML = `
@@ -644,6 +766,7 @@ async function handleProductSubmit(e) {
             if (imageResponse.ok) {
                 const imageData = await imageResponse.json();
                 productData.image_url = imageData.image_url;
+                productData.image_variants = imageData.image_variants;
             } else {
                 const errorData = await imageResponse.json();
                 throw new Error(errorData.detail || 'Image upload failed');
@@ -691,11 +814,10 @@ async function deleteProduct(productId) {
 
 async function loadAdminSettings() {
     try {
-        const [contactInfo, paymentInfo, companyInfo] = await Promise.all([
-            apiCall('/contact'),
-            apiCall('/payment-info'),
-            apiCall('/company-info')
-        ]);
+        const settings = await apiCall('/settings');
+        const contactInfo = settings.contact_info;
+        const paymentInfo = settings.payment_info;
+        const companyInfo = settings.company_info;
         
         // Populate company form
         document.getElementById('company-name').value = companyInfo.name;
@@ -735,20 +857,30 @@ async function handleCompanyUpdate(e) {
     }
 }
 
-async function loadPaymentUploads() {
+// Cursor for the next page of payment uploads, null when there are no more
+let paymentUploadsCursor = null;
+
+async function loadPaymentUploads(append = false) {
     try {
-        const uploads = await apiCall('/admin/payment-uploads');
-        displayPaymentUploads(uploads);
+        const params = new URLSearchParams();
+        const statusFilter = document.getElementById('payment-status-filter').value;
+        if (statusFilter) params.set('status', statusFilter);
+        if (append && paymentUploadsCursor) params.set('cursor', paymentUploadsCursor);
+        
+        const page = await apiCall(`/admin/payment-uploads?${params}`);
+        paymentUploadsCursor = page.next_cursor;
+        displayPaymentUploads(page.items, append);
+        document.getElementById('payment-uploads-more').style.display = paymentUploadsCursor ? 'block' : 'none';
     } catch (error) {
         console.error('Failed to load payment uploads:', error);
     }
 }
 
-function displayPaymentUploads(uploads) {
+function displayPaymentUploads(uploads, append = false) {
     const container = document.getElementById('payment-uploads-list');
-    container.innerHTML = '';
+    if (!append) container.innerHTML = '';
     
-    if (uploads.length === 0) {
+    if (uploads.length === 0 && !append) {
         container.innerHTML = '<p>No payment uploads found</p>';
         return;
     }
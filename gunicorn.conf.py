@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for running app.py in production (see start_server.py)
+
+Every setting can be overridden from the environment or .env.
+"""
+
+import asyncio
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("BIND", f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}")
+# One worker process per core; uvicorn picks uvloop and httptools when installed.
+# Caches and /metrics counters are per worker (see README)
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Recycle workers after a number of requests, staggered so they do not all restart at once
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+# Seconds a worker gets to finish in-flight requests on restart or shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+# Import app.py once in the master and fork workers from it
+preload_app = os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+accesslog = os.getenv("ACCESS_LOG") or None
+errorlog = "-"
+
+def when_ready(server):
+    """Warm the caches in the master so every forked worker starts with them"""
+    if not preload_app:
+        return
+    import app
+
+    try:
+        asyncio.run(app.warm_caches())
+        server.log.info("Warmed caches: %d products, %d settings", len(app.catalog.products), len(app.settings_store.values))
+    except Exception as e:
+        server.log.warning("Cache warm-up failed, workers will load on demand: %s", e)
+    # Workers must open their own Supabase connections and database threads
+    app.reset_connections()
@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 """
 Brownie Shop Server Startup Script
+
+    python start_server.py          # production: one worker per core (gunicorn.conf.py)
+    python start_server.py --dev    # single process that reloads on code changes
 """
 
+import argparse
+import importlib.util
 import os
 import sys
 import subprocess
 from pathlib import Path
 
+REQUIRED_VARS = [
+    "SUPABASE_URL",
+    "SUPABASE_KEY",
+    "SECRET_KEY"
+]
+
 def check_requirements():
     """Check if all required packages are installed"""
     try:
@@ -23,77 +34,80 @@ def check_requirements():
         return False
 
 def check_env_file():
-    """Check if .env file exists and has required variables"""
-    env_path = Path(".env")
-    if not env_path.exists():
-        print("✗ .env file not found")
-        print("Please copy .env.example to .env and fill in your credentials")
-        return False
-    
-    required_vars = [
-        "SUPABASE_URL",
-        "SUPABASE_KEY", 
-        "SECRET_KEY"
-    ]
-    
-    with open(env_path) as f:
-        env_content = f.read()
-    
-    missing_vars = []
-    for var in required_vars:
-        if f"{var}=your_" in env_content or f"{var}=" not in env_content:
-            missing_vars.append(var)
-    
+    """Check that the required variables are set, in .env or the environment"""
+    missing_vars = [var for var in REQUIRED_VARS if not os.getenv(var) or os.getenv(var).startswith("your_")]
+
     if missing_vars:
+        if not Path(".env").exists():
+            print("✗ .env file not found")
+            print("Please copy .env.example to .env and fill in your credentials")
         print(f"✗ Please configure these environment variables in .env:")
         for var in missing_vars:
             print(f"  - {var}")
         return False
-    
+
     print("✓ Environment configuration looks good")
     return True
 
-def start_server():
+def server_command(dev: bool):
+    port = os.getenv("PORT", "8000")
+    host = os.getenv("HOST", "0.0.0.0")
+    if dev:
+        return [sys.executable, "-m", "uvicorn", "app:app", "--host", host, "--port", port, "--reload"]
+    if os.name != "nt" and importlib.util.find_spec("gunicorn") is not None:
+        return [sys.executable, "-m", "gunicorn", "app:app", "--config", "gunicorn.conf.py"]
+    # Gunicorn is not available on Windows: uvicorn's own process manager,
+    # without the preload phase or staggered worker recycling
+    print("gunicorn not available - starting uvicorn workers without preloading")
+    return [
+        sys.executable, "-m", "uvicorn", "app:app",
+        "--host", host, "--port", port,
+        "--workers", os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)),
+        "--limit-max-requests", os.getenv("MAX_REQUESTS", "10000"),
+        "--timeout-graceful-shutdown", os.getenv("GRACEFUL_TIMEOUT", "30")
+    ]
+
+def start_server(dev: bool = False):
     """Start the FastAPI server"""
     print("Starting Brownie Shop server...")
-    print("Server will be available at: http://localhost:8000")
-    print("Admin login: admin@brownieshop.com / admin123")
+    print(f"Server will be available at: http://localhost:{os.getenv('PORT', '8000')}")
+    if dev:
+        print("Development mode: single process, reloads on code changes")
+    else:
+        print(f"Workers: {os.getenv('WEB_CONCURRENCY', os.cpu_count())} (send SIGHUP to the master for a graceful restart)")
     print("Press Ctrl+C to stop the server")
     print("-" * 50)
-    
+
     try:
-        # Change to backend directory and run the server
-        os.chdir("backend")
-        # Load environment variables from parent directory
-        from dotenv import load_dotenv
-        load_dotenv("../.env")
-        
-        subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "main:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000", 
-            "--reload"
-        ])
+        subprocess.run(server_command(dev))
     except KeyboardInterrupt:
         print("\nServer stopped.")
     except Exception as e:
         print(f"Error starting server: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Start the Brownie Shop server")
+    parser.add_argument("--dev", action="store_true", help="single process with auto-reload")
+    args = parser.parse_args()
+
     print("Brownie Shop - Server Startup")
     print("=" * 40)
-    
+
+    # Run from the repository root so app.py, frontend/ and uploads/ resolve
+    os.chdir(Path(__file__).resolve().parent)
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Check requirements
     if not check_requirements():
         sys.exit(1)
-    
+
     # Check environment
     if not check_env_file():
         sys.exit(1)
-    
+
     # Start server
-    start_server()
+    start_server(args.dev)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,50 @@
+"""
+Shared fixtures: app.py imported once against the in-memory PostgREST and
+SMTP stand-ins from benchmarks/, with its job queue in a temporary file.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from common import load_app
+from fake_postgrest import FakePostgREST
+from fake_smtp import FakeSMTP
+
+@pytest.fixture(scope="session")
+def backend():
+    fake = FakePostgREST()
+    fake.start()
+    yield fake
+    fake.stop()
+
+@pytest.fixture(scope="session")
+def smtp_server():
+    fake = FakeSMTP()
+    fake.start()
+    yield fake
+    fake.stop()
+
+@pytest.fixture(scope="session")
+def app_module(backend, smtp_server, tmp_path_factory):
+    host, port = smtp_server.address
+    return load_app(
+        backend.url,
+        STARTUP_MODE="lazy",
+        JOB_DB_PATH=tmp_path_factory.mktemp("jobs") / "jobs.sqlite3",
+        SMTP_SERVER=host,
+        SMTP_PORT=port,
+        SMTP_USERNAME="shop@example.com",
+        SMTP_PASSWORD="",
+        SMTP_STARTTLS="false",
+    )
+
+@pytest.fixture
+def uploads(app_module, tmp_path, monkeypatch):
+    """Local upload storage in a temporary directory"""
+    storage = app_module.LocalStorage(tmp_path)
+    monkeypatch.setattr(app_module, "upload_storage", storage)
+    return storage
@@ -0,0 +1,11 @@
+import asyncio
+
+def test_product_created_elsewhere_is_found(app_module, backend):
+    asyncio.run(app_module.catalog.load())
+    product = backend.insert("products", {"name": "Fudge Brownie", "price": 90, "available": True})
+
+    assert asyncio.run(app_module.catalog.get(product["id"]))["name"] == "Fudge Brownie"
+    assert product["id"] in app_module.catalog.products
+
+def test_unknown_product_is_none(app_module):
+    assert asyncio.run(app_module.catalog.get(999999)) is None
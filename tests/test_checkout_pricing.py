@@ -0,0 +1,30 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+@pytest.fixture
+def stale_catalog(app_module, backend):
+    """A product whose price changed in the database after this worker cached it"""
+    product = backend.insert("products", {"name": "Walnut Brownie", "price": 100, "available": True, "image_url": None})
+    asyncio.run(app_module.catalog.load())
+    product["price"] = 120
+    return product
+
+def test_checkout_charges_the_database_price(app_module, stale_catalog):
+    items = [app_module.OrderItem(product_id=stale_catalog["id"], quantity=2)]
+
+    lines, total = asyncio.run(app_module.price_order(items))
+
+    assert total == Decimal("240.00")
+    assert lines[0]["price"] == Decimal("120.00")
+    assert app_module.catalog.products[stale_catalog["id"]]["price"] == 120
+
+def test_cart_total_matches_checkout(app_module, backend, stale_catalog):
+    backend.insert("cart", {"user_email": "pricing@example.com", "product_id": stale_catalog["id"], "quantity": 2})
+
+    cart = asyncio.run(app_module.load_cart("pricing@example.com"))
+
+    assert cart["total"] == 240.0
+    assert cart["items"][0]["products"]["price"] == 120
+    assert not app_module.catalog.is_fresh()
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+
+import pytest
+
+@pytest.fixture
+def queue(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "JOB_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(app_module, "JOB_RETRY_BASE_SECONDS", 0)
+    return app_module.JobQueue(str(tmp_path / "jobs.sqlite3"), 0)
+
+def drain(queue):
+    """Run due jobs until none are left, returning how many runs it took"""
+    runs = 0
+    while jobs := queue.claim():
+        queue.run(jobs)
+        runs += 1
+    return runs
+
+def test_failed_job_is_retried_until_it_succeeds(queue):
+    calls = []
+
+    @queue.handler("flaky")
+    def flaky(value: int):
+        calls.append(value)
+        if len(calls) < 2:
+            raise RuntimeError("temporary")
+
+    queue.enqueue("flaky", {"value": 7})
+
+    assert drain(queue) == 2
+    assert calls == [7, 7]
+    stats = queue.stats()
+    assert (stats["processed"], stats["retried"], stats["queue_depth"], stats["failed_jobs"]) == (1, 1, 0, 0)
+
+def test_job_is_dead_lettered_after_max_attempts(queue):
+    @queue.handler("broken")
+    def broken():
+        raise RuntimeError("still broken")
+
+    queue.enqueue("broken", {})
+
+    assert drain(queue) == 3
+    assert queue.stats()["failed_jobs"] == 1
+    status, attempts, last_error = queue.connection().execute("SELECT status, attempts, last_error FROM jobs").fetchone()
+    assert (status, attempts, last_error) == ("failed", 3, "still broken")
+
+def test_permanent_error_skips_retries(app_module, queue):
+    @queue.handler("rejected")
+    def rejected():
+        raise app_module.PermanentJobError("refused")
+
+    queue.enqueue("rejected", {})
+
+    assert drain(queue) == 1
+    assert queue.stats()["failed_jobs"] == 1
+
+def test_batch_handler_receives_every_pending_job(queue):
+    batches = []
+    queue.handler("digest", batch=True)(batches.append)
+
+    for value in range(3):
+        queue.enqueue("digest", {"value": value}, delay=60 if value else 0)
+
+    assert drain(queue) == 1
+    assert batches == [[{"value": 0}, {"value": 1}, {"value": 2}]]
+
+def test_expired_lease_is_claimed_again(app_module, queue, monkeypatch):
+    queue.handler("slow")(lambda: None)
+    queue.enqueue("slow", {})
+    monkeypatch.setattr(app_module, "JOB_LEASE_SECONDS", -1)
+
+    # A worker that died mid-job leaves it running with a lapsed lease
+    assert len(queue.claim()) == 1
+    jobs = queue.claim()
+
+    assert len(jobs) == 1 and jobs[0][3] == 1
+
+def test_job_without_handler_is_marked_failed(queue):
+    queue.enqueue("renamed_handler", {})
+
+    assert drain(queue) == 1
+    status, last_error = queue.connection().execute("SELECT status, last_error FROM jobs").fetchone()
+    assert (status, last_error) == ("failed", "No handler registered for renamed_handler")
+
+def test_worker_survives_queue_errors(queue, monkeypatch):
+    done = threading.Event()
+    queue.handler("ok")(done.set)
+    queue.workers = 1
+    original_run = queue.run
+
+    def run_once_broken(jobs):
+        monkeypatch.setattr(queue, "run", original_run)
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(queue, "run", run_once_broken)
+    queue.enqueue("ok", {})
+    queue.enqueue("ok", {})
+    queue.start()
+    try:
+        assert done.wait(5)
+        assert queue.stats()["workers"] == 1
+    finally:
+        queue.stop()
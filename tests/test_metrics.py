@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+@pytest.fixture
+def metrics(app_module, monkeypatch):
+    registry = app_module.MetricsRegistry()
+    monkeypatch.setattr(app_module, "metrics", registry)
+    return registry
+
+def request(app_module, method: str, path: str, **kwargs):
+    async def send():
+        async with httpx.AsyncClient(app=app_module.app, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+def test_rejected_upload_is_counted(app_module, metrics):
+    headers = {"Content-Type": "multipart/form-data; boundary=x", "Content-Length": str(app_module.UPLOAD_MAX_BYTES * 2)}
+    response = request(app_module, "POST", "/api/admin/upload-image", headers=headers, content=b"")
+
+    assert response.status_code == 413
+    assert "Server-Timing" in response.headers
+    assert metrics.requests == {("POST", "unmatched", "413"): 1}
+
+def test_unhandled_exception_is_counted_as_500(app_module, metrics):
+    async def explode():
+        raise RuntimeError("boom")
+    app_module.app.add_api_route("/test/explode", explode)
+    try:
+        with pytest.raises(RuntimeError):
+            request(app_module, "GET", "/test/explode")
+    finally:
+        app_module.app.router.routes.pop()
+
+    assert metrics.requests == {("GET", "/test/explode", "500"): 1}
+
+def test_background_queries_are_counted(app_module, backend, metrics):
+    backend.seed("orders", [{"id": 41, "total_amount": 250}])
+    result = app_module.execute_query(app_module.table("orders").select("id, total_amount").eq("id", 41))
+
+    assert result.data == [{"id": 41, "total_amount": 250}]
+    assert metrics.backend_calls == {"supabase": 1}
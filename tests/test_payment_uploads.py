@@ -0,0 +1,28 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+def test_cursor_round_trip(app_module):
+    row = {"upload_time": "2026-10-17T12:30:45.123456", "id": 42}
+
+    cursor = app_module.encode_cursor(row)
+
+    assert "=" not in cursor
+    assert app_module.decode_cursor(cursor) == ("2026-10-17T12:30:45.123456", 42)
+
+def encode(value: str):
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode("{}"),
+    encode('["2026-10-17T12:30:45", 1, 2]'),
+    encode('["2026-10-17T12:30:45", "x"]'),
+    # upload_time ends up inside a PostgREST filter, so anything but a timestamp is refused
+    encode('["2026-10-17),id.gt.0", 1]'),
+])
+def test_invalid_cursors_are_rejected(app_module, cursor):
+    with pytest.raises(HTTPException) as error:
+        app_module.decode_cursor(cursor)
+    assert error.value.status_code == 400
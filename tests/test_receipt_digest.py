@@ -0,0 +1,68 @@
+import pytest
+
+def store_receipt(storage, order_id: int, size: int):
+    key = f"receipt-{order_id}.pdf"
+    storage.path(key).write_bytes(bytes([order_id % 256]) * size)
+    return {
+        "order_id": order_id,
+        "email": f"customer{order_id}@example.com",
+        "filename": key,
+        "notes": "",
+        "uploaded_at": "2026-10-17T12:00:00"
+    }
+
+@pytest.fixture
+def requeued(app_module, monkeypatch):
+    jobs = []
+    monkeypatch.setattr(app_module.job_queue, "enqueue", lambda name, payload, delay=0: jobs.append((name, payload)))
+    return jobs
+
+@pytest.fixture
+def smtp(smtp_server):
+    smtp_server.messages.clear()
+    yield smtp_server
+    smtp_server.reject_code = 0
+
+def test_digest_attachments_stay_under_the_limit(app_module, uploads, smtp, requeued, monkeypatch):
+    monkeypatch.setattr(app_module, "SMTP_MAX_ATTACHMENT_BYTES", 1000)
+    receipts = [store_receipt(uploads, order_id, 400) for order_id in (1, 2, 3)]
+
+    app_module.payment_receipt_email_job(receipts)
+
+    assert len(smtp.messages) == 1
+    assert smtp.messages[0]["attachments"] == ["receipt-1.pdf", "receipt-2.pdf"]
+    assert requeued == [("payment_receipt_email", receipts[2])]
+
+def test_oversized_receipt_is_listed_not_attached(app_module, uploads, smtp, requeued, monkeypatch):
+    monkeypatch.setattr(app_module, "SMTP_MAX_ATTACHMENT_BYTES", 1000)
+    receipts = [store_receipt(uploads, 1, 5000), store_receipt(uploads, 2, 400)]
+
+    app_module.payment_receipt_email_job(receipts)
+
+    message = smtp.messages[0]
+    assert message["attachments"] == ["receipt-2.pdf"]
+    body = message["message"].get_payload()[0].get_payload(decode=True).decode()
+    assert "receipt-1.pdf (too large to attach" in body
+    assert requeued == []
+
+def test_permanent_rejection_is_not_retried(app_module, uploads, smtp, tmp_path):
+    smtp.reject_code = 550
+    queue = app_module.JobQueue(str(tmp_path / "jobs.sqlite3"), 0)
+    queue.handler("payment_receipt_email", batch=True)(app_module.payment_receipt_email_job)
+    queue.enqueue("payment_receipt_email", store_receipt(uploads, 1, 100))
+
+    queue.run(queue.claim())
+
+    assert queue.stats()["failed_jobs"] == 1
+    assert queue.retried == 0
+
+def test_temporary_rejection_is_retried(app_module, uploads, smtp, tmp_path):
+    smtp.reject_code = 451
+    queue = app_module.JobQueue(str(tmp_path / "jobs.sqlite3"), 0)
+    queue.handler("payment_receipt_email", batch=True)(app_module.payment_receipt_email_job)
+    queue.enqueue("payment_receipt_email", store_receipt(uploads, 1, 100))
+
+    queue.run(queue.claim())
+
+    assert queue.stats()["failed_jobs"] == 0
+    assert queue.retried == 1
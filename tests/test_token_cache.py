@@ -0,0 +1,33 @@
+import time
+
+def test_hit_after_put(app_module):
+    cache = app_module.TokenCache(4)
+    cache.put("token", "user@example.com", time.time() + 60)
+
+    assert cache.get("token") == "user@example.com"
+    assert cache.get("other") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_expired_tokens_are_dropped(app_module):
+    cache = app_module.TokenCache(4)
+    cache.put("token", "user@example.com", time.time() - 1)
+
+    assert cache.get("token") is None
+    assert cache.entries == {}
+
+def test_least_recently_used_token_is_evicted(app_module):
+    cache = app_module.TokenCache(2)
+    expires_at = time.time() + 60
+    cache.put("a", "a@example.com", expires_at)
+    cache.put("b", "b@example.com", expires_at)
+    cache.get("a")
+    cache.put("c", "c@example.com", expires_at)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a@example.com"
+
+def test_tokens_without_expiry_are_not_cached(app_module):
+    cache = app_module.TokenCache(2)
+    cache.put("token", "user@example.com", None)
+
+    assert cache.get("token") is None
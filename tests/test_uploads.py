@@ -0,0 +1,45 @@
+import pytest
+from fastapi import HTTPException
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=999-999", (999, 999)),
+    ("BYTES = 0-0", (0, 0)),
+])
+def test_single_ranges(app_module, header, expected):
+    assert app_module.parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", [
+    "items=0-99",
+    "bytes=0-9,20-29",
+    "bytes=50-10",
+    "bytes=abc-",
+    "bytes=-",
+    "bytes=",
+    "bytes=--5",
+    "bytes=+5-10",
+    "bytes=5--3",
+])
+def test_unusable_ranges_send_the_whole_file(app_module, header):
+    assert app_module.parse_range(header, 1000) is None
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_unsatisfiable_ranges(app_module, header):
+    with pytest.raises(HTTPException) as error:
+        app_module.parse_range(header, 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers == {"Content-Range": "bytes */1000"}
+
+def test_etag_comes_from_the_content_hash_in_the_key(app_module):
+    key = "payment_" + "ab" * 32 + ".jpg"
+    assert app_module.upload_etag(key, 1, 10) == f'"{key}"'
+    assert app_module.upload_etag("e4a82a01-dc3e-4d9f-957c-0b1237780517.jpg", 0x10, 0x20) == 'W/"20-10"'
+
+def test_weak_etags_match_if_none_match(app_module):
+    assert app_module.etag_matches('W/"20-10"', 'W/"20-10"')
+    assert app_module.etag_matches('"20-10"', 'W/"20-10"')
+    assert not app_module.etag_matches('W/"20-11"', 'W/"20-10"')